@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+import asyncpg
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.cache import TTLCache
+from src.config import settings
+from src.models.user import User, UserRole
+
+# memory: caché LRU por proceso + invalidación entre réplicas con LISTEN/NOTIFY
+# redis:  caché compartida (cualquier servidor compatible con Redis)
+AUTH_CACHE_BACKEND = os.getenv("AUTH_CACHE_BACKEND", "memory")
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_MAXSIZE = int(os.getenv("AUTH_CACHE_MAXSIZE", "50000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+NOTIFY_CHANNEL = "auth_invalidate"
+
+# Campos del usuario que viajan en la caché (nunca el hash de la contraseña)
+_CACHED_FIELDS = (
+    "id", "email", "full_name", "phone_number", "is_active", "role",
+    "active_token_hash", "created_at", "updated_at"
+)
+
+def _snapshot(user: User) -> dict:
+    return {field: getattr(user, field) for field in _CACHED_FIELDS}
+
+def _to_json(snapshot: dict) -> str:
+    data = dict(snapshot)
+    data["role"] = data["role"].value if data["role"] is not None else None
+    for field in ("created_at", "updated_at"):
+        if data[field] is not None:
+            data[field] = data[field].isoformat()
+    return json.dumps(data)
+
+def _from_json(raw: str | bytes) -> dict:
+    data = json.loads(raw)
+    data["role"] = UserRole(data["role"]) if data["role"] is not None else None
+    for field in ("created_at", "updated_at"):
+        if data[field] is not None:
+            data[field] = datetime.fromisoformat(data[field])
+    return data
+
+# Generaciones: cada invalidación incrementa la del token. get_current_user
+# lee la generación ANTES de consultar la BD y la caché solo se rellena si no
+# ha cambiado; así una invalidación que llega entre la consulta y el `set` no
+# deja en caché una sesión ya cerrada. Basta con recordarlas un rato más que
+# lo que tarda esa consulta.
+GENERATION_TTL = 300
+
+class MemoryAuthCache:
+    """
+    Caché en el proceso. Solo responde mientras el listener de invalidaciones
+    está conectado: si se pierde, no podemos saber si otra réplica cerró una
+    sesión, así que todo va a la base de datos hasta reconectar.
+    """
+
+    def __init__(self):
+        self._cache = TTLCache(ttl=AUTH_CACHE_TTL, maxsize=AUTH_CACHE_MAXSIZE)
+        self._generations = TTLCache(ttl=GENERATION_TTL, maxsize=AUTH_CACHE_MAXSIZE)
+        # Cambia con cada clear() (reconexión del listener: pudimos perder avisos)
+        self._epoch = 0
+        self.listening = False
+
+    async def get(self, token_hash: str) -> dict | None:
+        if not self.listening:
+            return None
+        return self._cache.get(token_hash)
+
+    async def generation(self, token_hash: str) -> tuple[int, int]:
+        return self._epoch, self._generations.get(token_hash, 0)
+
+    async def set(self, token_hash: str, snapshot: dict, ttl: float, generation: tuple[int, int]):
+        if self.listening and await self.generation(token_hash) == generation:
+            self._cache.set(token_hash, snapshot, ttl=ttl)
+
+    async def delete(self, *token_hashes: str):
+        for token_hash in token_hashes:
+            self.invalidate_local(token_hash)
+
+    def invalidate_local(self, token_hash: str):
+        self._generations.set(token_hash, self._generations.get(token_hash, 0) + 1)
+        self._cache.invalidate(token_hash)
+
+    def clear(self):
+        self._epoch += 1
+        self._cache.clear()
+
+class RedisAuthCache:
+    """Caché compartida entre réplicas: un DEL invalida en todas a la vez."""
+
+    # SET solo si la generación no ha cambiado desde la lectura de la BD
+    _SET_IF_GENERATION = """
+    if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[3] then return 0 end
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+    """
+
+    def __init__(self, url: str):
+        # Dependencia opcional: solo hace falta con AUTH_CACHE_BACKEND=redis
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+        self._set_if_generation = self._redis.register_script(self._SET_IF_GENERATION)
+
+    async def get(self, token_hash: str) -> dict | None:
+        raw = await self._redis.get(f"auth:{token_hash}")
+        return _from_json(raw) if raw is not None else None
+
+    async def generation(self, token_hash: str) -> str:
+        raw = await self._redis.get(f"auth:gen:{token_hash}")
+        return raw.decode() if raw is not None else "0"
+
+    async def set(self, token_hash: str, snapshot: dict, ttl: float, generation: str):
+        await self._set_if_generation(
+            keys=[f"auth:{token_hash}", f"auth:gen:{token_hash}"],
+            args=[_to_json(snapshot), int(ttl * 1000), generation],
+        )
+
+    async def delete(self, *token_hashes: str):
+        if not token_hashes:
+            return
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for token_hash in token_hashes:
+                pipe.incr(f"auth:gen:{token_hash}")
+                pipe.expire(f"auth:gen:{token_hash}", GENERATION_TTL)
+            pipe.delete(*(f"auth:{h}" for h in token_hashes))
+            await pipe.execute()
+
+if AUTH_CACHE_BACKEND == "redis":
+    auth_cache = RedisAuthCache(REDIS_URL)
+else:
+    auth_cache = MemoryAuthCache()
+
+# --- API PARA security.py Y LOS ROUTERS ---
+async def get_cached_user(token_hash: str) -> User | None:
+    """Devuelve un User transitorio (fuera de la sesión) si el token está en caché."""
+    snapshot = await auth_cache.get(token_hash)
+    if snapshot is None:
+        return None
+    return User(**snapshot)
+
+async def session_generation(token_hash: str):
+    """Leer antes de consultar el usuario en la BD y pasarla a `cache_user`."""
+    return await auth_cache.generation(token_hash)
+
+async def cache_user(token_hash: str, user: User, token_exp: float, generation):
+    # Nunca más allá de la expiración del propio JWT
+    ttl = min(AUTH_CACHE_TTL, token_exp - time.time())
+    if ttl > 0:
+        await auth_cache.set(token_hash, _snapshot(user), ttl, generation)
+
+async def invalidate_sessions(db: AsyncSession, *token_hashes: str | None):
+    """
+    Invalida sesiones en caché tras un cambio (login, refresh, logout, rol,
+    activación, perfil). Llamar DESPUÉS del commit del cambio.
+    """
+    token_hashes = tuple(h for h in token_hashes if h)
+    if not token_hashes:
+        return
+    await auth_cache.delete(*token_hashes)
+
+    if isinstance(auth_cache, MemoryAuthCache):
+        # Avisamos al resto de réplicas (se entrega al hacer commit)
+        for token_hash in token_hashes:
+            await db.execute(select(func.pg_notify(NOTIFY_CHANNEL, token_hash)))
+        await db.commit()
+
+# --- LISTENER DE INVALIDACIONES (solo backend memory) ---
+async def run_invalidation_listener(retry_seconds: float = 5):
+    """Escucha NOTIFY auth_invalidate. Se arranca desde el lifespan de la app."""
+    if not isinstance(auth_cache, MemoryAuthCache):
+        return
+
+    def on_notify(connection, pid, channel, payload):
+        auth_cache.invalidate_local(payload)
+
+    # LISTEN necesita una sesión fija: conexión directa, no la del pooler
+    dsn = settings.listen_database_url.replace("+asyncpg", "")
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(dsn, **settings.asyncpg_connect_args())
+            await conn.add_listener(NOTIFY_CHANNEL, on_notify)
+            # Lo cacheado antes de escuchar pudo perderse alguna invalidación
+            auth_cache.clear()
+            auth_cache.listening = True
+            while True:
+                await asyncio.sleep(retry_seconds)
+                # Keepalive: detecta conexiones caídas en silencio
+                await conn.execute("SELECT 1", timeout=retry_seconds)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            print(f" [auth-cache] Listener desconectado: {exc!r}")
+        finally:
+            auth_cache.listening = False
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(retry_seconds)
@@ -1,27 +1,25 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-import os
+from src.config import settings
+from src.metrics import InstrumentedPool, instrument_engine
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_URL = settings.require_database_url()
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL no está configurada")
-
-# Configuración SSL para Neon
-connect_args = {}
-if "neon.tech" in DATABASE_URL:
-    connect_args = {"ssl": "require"}
-
-# 1. Crear el motor asíncrono
+# 1. Crear el motor asíncrono (ajustes en src/config.py)
 engine = create_async_engine(
     DATABASE_URL,
-    echo=True,
+    echo=settings.sql_echo,
     future=True,
-    connect_args=connect_args,
-    # --- AGREGA ESTAS DOS LÍNEAS NUEVAS ---
-    pool_pre_ping=True,   # Verifica la conexión antes de usarla (Vital para Neon)
-    pool_recycle=300      # Recicla conexiones cada 5 minutos para evitar timeouts
+    connect_args=settings.engine_connect_args(),
+    poolclass=InstrumentedPool,   # Mide la espera por conexión (/metrics)
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    pool_recycle=settings.db_pool_recycle
 )
+# Número y duración de las consultas por petición (/metrics)
+instrument_engine(engine.sync_engine)
 
 # 2. Configurar la fábrica de sesiones
 AsyncSessionLocal = async_sessionmaker(
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from src.metrics import BCRYPT_SECONDS, BCRYPT_REJECTED
+
+# --- CONFIGURACIÓN ---
+# Cambiar BCRYPT_ROUNDS hace que los hashes con otro coste se regeneren al
+# siguiente login (min/max fijados al mismo valor => needs_update).
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_POOL_KIND = os.getenv("HASH_POOL_KIND", "thread")  # thread | process
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(os.cpu_count() or 2)))
+# Trabajos admitidos a la vez (en ejecución + en cola). Por encima: 503.
+HASH_POOL_MAX_PENDING = int(os.getenv("HASH_POOL_MAX_PENDING", "64"))
+HASH_POOL_RETRY_AFTER = int(os.getenv("HASH_POOL_RETRY_AFTER", "2"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# --- FUNCIONES QUE CORREN EN EL POOL ---
+# A nivel de módulo para que ProcessPoolExecutor pueda serializarlas.
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_and_update(plain_password: str, hashed_password: str):
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+# --- POOL ACOTADO ---
+class HashPoolStats:
+    def __init__(self):
+        self.pending = 0
+        self.calls = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "kind": HASH_POOL_KIND,
+            "workers": HASH_POOL_WORKERS,
+            "max_pending": HASH_POOL_MAX_PENDING,
+            "pending": self.pending,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "avg_ms": round(1000 * self.total_seconds / self.calls, 2) if self.calls else 0.0,
+            "max_ms": round(1000 * self.max_seconds, 2),
+        }
+
+stats = HashPoolStats()
+_executor: Executor | None = None
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if HASH_POOL_KIND == "process":
+            _executor = ProcessPoolExecutor(max_workers=HASH_POOL_WORKERS)
+        else:
+            # bcrypt libera el GIL, así que los hilos sí trabajan en paralelo
+            _executor = ThreadPoolExecutor(
+                max_workers=HASH_POOL_WORKERS, thread_name_prefix="bcrypt"
+            )
+    return _executor
+
+def shutdown_hash_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+async def _run_in_pool(operation: str, fn, *args):
+    """
+    Ejecuta bcrypt fuera del event loop. Si ya hay HASH_POOL_MAX_PENDING
+    trabajos, rechaza con 503 + Retry-After en vez de encolar sin límite.
+    """
+    if stats.pending >= HASH_POOL_MAX_PENDING:
+        stats.rejected += 1
+        BCRYPT_REJECTED.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, inténtalo de nuevo en unos segundos",
+            headers={"Retry-After": str(HASH_POOL_RETRY_AFTER)},
+        )
+
+    stats.pending += 1
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.pending -= 1
+        stats.calls += 1
+        stats.total_seconds += elapsed
+        stats.max_seconds = max(stats.max_seconds, elapsed)
+        BCRYPT_SECONDS.labels(operation).observe(elapsed)
+
+# --- API ASÍNCRONA ---
+async def hash_password(password: str) -> str:
+    return await _run_in_pool("hash", _hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """
+    Devuelve (valida, nuevo_hash). `nuevo_hash` no es None cuando el hash
+    guardado usa otro coste y hay que sustituirlo (rehash transparente).
+    """
+    return await _run_in_pool("verify", _verify_and_update, plain_password, hashed_password)
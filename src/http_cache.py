@@ -0,0 +1,36 @@
+import hashlib
+import json
+
+from fastapi import Request, Response
+
+class CachedBody:
+    """Respuesta JSON ya serializada con su ETag fuerte (hash del cuerpo)."""
+    __slots__ = ("body", "etag")
+
+    def __init__(self, data):
+        self.body = json.dumps(data, separators=(",", ":"), default=str).encode()
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match usa comparación débil (RFC 9110 §13.1.2): un proxy o CDN
+    # puede devolver nuestro ETag como W/"..." y debe seguir valiendo
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = _opaque_tag(etag)
+    return any(_opaque_tag(tag) == opaque for tag in if_none_match.split(","))
+
+def conditional_response(request: Request, cached: CachedBody, max_age: int) -> Response:
+    """200 con el cuerpo, o 304 sin cuerpo si el cliente ya tiene esa versión."""
+    headers = {
+        "ETag": cached.etag,
+        "Cache-Control": f"public, max-age={max_age}",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
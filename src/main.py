@@ -1,15 +1,66 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from contextlib import asynccontextmanager
-from src.database import engine, Base
-from src.routers import tickets, auth, events, admin, users
+import asyncio
+import os
+from sqlalchemy import text
+from src.database import engine, Base, AsyncSessionLocal
+from src.schema import upgrade_schema
+from src.routers import tickets, auth, events, admin, users, bookings, waiting_room
+from src.services.booking_service import run_hold_reaper
+from src.services.event_service import fail_stale_ticket_jobs
+from src.auth_cache import run_invalidation_listener
+from src.hashing import shutdown_hash_pool
+from src.rabbitmq_client import publisher
+from src.services.outbox_service import run_outbox_relay
+from src.services.idempotency_service import run_idempotency_janitor
+from src.services.analytics_service import run_rollup_compaction
+from src.rate_limit import RateLimitMiddleware
+from src.metrics import MetricsMiddleware, render_metrics
 from src.docs_custom import custom_openapi, custom_css
+
+# Relay del outbox dentro de la API (se puede desactivar y lanzar aparte
+# con `python -m src.outbox_relay`; varios relays pueden convivir)
+OUTBOX_RELAY_IN_APP = os.getenv("OUTBOX_RELAY_IN_APP", "true").lower() == "true"
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
+        # Índices trigram para las búsquedas ILIKE '%term%'
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
+        # Columnas e índices nuevos en tablas que ya existían
+        await conn.run_sync(upgrade_schema)
+    # Jobs de generación de tickets que un reinicio dejó a medias
+    async with AsyncSessionLocal() as db:
+        failed_jobs = await fail_stale_ticket_jobs(db)
+    if failed_jobs:
+        print(f" [!] {failed_jobs} jobs de generación de tickets interrumpidos marcados como FAILED")
+    # Libera periódicamente las retenciones de asientos vencidas
+    reaper_task = asyncio.create_task(run_hold_reaper())
+    # Invalidaciones de la caché de sesiones entre réplicas
+    listener_task = asyncio.create_task(run_invalidation_listener())
+    # Borrado por lotes de las Idempotency-Key caducadas
+    janitor_task = asyncio.create_task(run_idempotency_janitor())
+    # Funde los shards de los rollups de ventas de los minutos ya cerrados
+    compaction_task = asyncio.create_task(run_rollup_compaction())
+    # Conexión persistente a RabbitMQ (si no está, se publica sin pool)
+    try:
+        await publisher.start()
+    except Exception as exc:
+        print(f" [!] RabbitMQ no disponible al arrancar: {exc!r}")
+    relay_task = asyncio.create_task(run_outbox_relay()) if OUTBOX_RELAY_IN_APP else None
     yield
+    if relay_task:
+        relay_task.cancel()
+    # Vaciamos los mensajes pendientes antes de cerrar la conexión
+    await publisher.stop()
+    reaper_task.cancel()
+    listener_task.cancel()
+    janitor_task.cancel()
+    compaction_task.cancel()
+    shutdown_hash_pool()
 
 app = FastAPI(
     title="EventScale API", 
@@ -24,14 +75,23 @@ origins = [
     "https://portafolio-blond-five-68.vercel.app/"
 ]
 
+# Se registra antes que CORS para quedar por dentro: los 429 llevan
+# cabeceras CORS y el navegador puede leerlos
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cabeceras de paginación legibles desde el frontend
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
+# El más externo: mide también los 429 y las respuestas CORS
+app.add_middleware(MetricsMiddleware)
+
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
     html = custom_openapi(app)
@@ -39,10 +99,18 @@ async def custom_swagger_ui_html():
 
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
 app.include_router(tickets.router, prefix="/tickets", tags=["Tickets"])
+app.include_router(bookings.router, prefix="/bookings", tags=["Bookings"])
 app.include_router(events.router, prefix="/events", tags=["Events"]) 
+app.include_router(waiting_room.router, prefix="/queue", tags=["Waiting Room"])
 app.include_router(admin.router, prefix="/admin", tags=["Admin Panel"])
 app.include_router(users.router, prefix="/users", tags=["User Management (Admin Only)"])
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métricas en formato Prometheus (latencias, BD, bcrypt, RabbitMQ)."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/")
 def root():
     return {"message": "EventScale API is running 🚀"}
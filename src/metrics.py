@@ -0,0 +1,143 @@
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Este módulo no importa la app ni la base de datos: lo usan database.py,
+# hashing.py, rabbitmq_client.py y el worker.
+
+# Escalas: una petición HTTP va de ~1 ms a segundos; una consulta, de µs a ms
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+# --- MÉTRICAS ---
+HTTP_REQUEST_SECONDS = Histogram(
+    "eventscale_http_request_seconds", "Latencia de las peticiones HTTP",
+    ["method", "route", "status"], buckets=_LATENCY_BUCKETS,
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "eventscale_db_queries_per_request", "Consultas SQL por petición HTTP",
+    ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_SECONDS_PER_REQUEST = Histogram(
+    "eventscale_db_seconds_per_request", "Tiempo en la base de datos por petición HTTP",
+    ["route"], buckets=_LATENCY_BUCKETS,
+)
+DB_QUERY_SECONDS = Histogram(
+    "eventscale_db_query_seconds", "Duración de cada sentencia SQL",
+    buckets=_QUERY_BUCKETS,
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "eventscale_db_pool_wait_seconds", "Espera para obtener una conexión del pool",
+    buckets=_QUERY_BUCKETS,
+)
+BCRYPT_SECONDS = Histogram(
+    "eventscale_bcrypt_seconds", "Duración de bcrypt, incluida la cola del pool",
+    ["operation"], buckets=_LATENCY_BUCKETS,
+)
+BCRYPT_REJECTED = Counter(
+    "eventscale_bcrypt_rejected_total", "Trabajos de bcrypt rechazados con 503 (pool lleno)",
+)
+RABBITMQ_PUBLISH_SECONDS = Histogram(
+    "eventscale_rabbitmq_publish_seconds", "Lote publicado hasta su último confirm",
+    buckets=_LATENCY_BUCKETS,
+)
+RABBITMQ_PUBLISHED = Counter(
+    "eventscale_rabbitmq_published_total", "Mensajes publicados en RabbitMQ",
+    ["outcome"],
+)
+WORKER_JOB_SECONDS = Histogram(
+    "eventscale_worker_job_seconds", "Procesado de un grupo de trabajos del worker",
+    ["type", "outcome"], buckets=_LATENCY_BUCKETS,
+)
+WORKER_JOBS = Counter(
+    "eventscale_worker_jobs_total", "Trabajos procesados por el worker",
+    ["type", "outcome"],
+)
+
+# --- CONSULTAS POR PETICIÓN ---
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+
+# SQLAlchemy copia el contexto al greenlet de cada operación, así que los
+# eventos del engine ven el RequestStats de la petición en curso.
+_request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+def instrument_engine(sync_engine):
+    """Registra los eventos que cronometran cada sentencia (engine.sync_engine)."""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY_SECONDS.observe(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        # La sentencia falló: no habrá after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Pool de conexiones que mide cuánto se espera por una conexión libre."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+# --- MIDDLEWARE ---
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro: latencia por ruta (la plantilla, p. ej.
+    /tickets/buy/{ticket_id}, no la URL) y consultas/tiempo de BD por petición.
+    """
+
+    def __init__(self, app, exclude: tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_stats.reset(token)
+            # FastAPI deja la ruta resuelta en el scope; sin ella, no inventamos etiquetas
+            route = scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status_code)).observe(elapsed)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(stats.queries)
+            DB_SECONDS_PER_REQUEST.labels(route).observe(stats.db_seconds)
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
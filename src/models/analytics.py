@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, BigInteger, DateTime, ForeignKey, Index
+from src.database import Base
+
+class SalesRollup(Base):
+    """
+    Ventas agregadas por evento y minuto, mantenidas en la misma transacción
+    que cada compra o liberación (ver services/analytics_service.py).
+
+    Como el inventario, cada minuto tiene varias filas (shards) para que las
+    compras simultáneas no se peleen por la fila del minuto en curso; la
+    compactación las funde en el shard 0 cuando el minuto ya está cerrado.
+    """
+    __tablename__ = "sales_rollups"
+    __table_args__ = (
+        # Informes diarios de todos los eventos
+        Index("ix_sales_rollups_bucket", "bucket"),
+    )
+
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True)  # date_trunc('minute', ...)
+    shard = Column(Integer, primary_key=True)
+    tickets_sold = Column(Integer, default=0, nullable=False)
+    revenue = Column(BigInteger, default=0, nullable=False)
+    tickets_released = Column(Integer, default=0, nullable=False)
+    revenue_released = Column(BigInteger, default=0, nullable=False)
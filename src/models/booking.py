@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, ForeignKey, Enum, DateTime, Index
+from sqlalchemy.sql import func
+import enum
+from src.database import Base
+
+class BookingStatus(str, enum.Enum):
+    PENDING = "pending"      # Asientos retenidos (LOCKED), esperando el pago
+    CONFIRMED = "confirmed"  # Pago confirmado, asientos vendidos
+    EXPIRED = "expired"      # El reaper liberó los asientos
+    CANCELLED = "cancelled"  # El usuario abandonó el checkout
+
+class Booking(Base):
+    __tablename__ = "bookings"
+    __table_args__ = (
+        # Barrido del reaper: reservas pendientes ya vencidas
+        Index("ix_bookings_status_expires_at", "status", "expires_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(Enum(BookingStatus), default=BookingStatus.PENDING, nullable=False)
+    ticket_count = Column(Integer, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -1,14 +1,30 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Index, false
 from sqlalchemy.orm import relationship
 from src.database import Base
 
 class Event(Base):
     __tablename__ = "events"
+    __table_args__ = (
+        # Catálogo: paginación keyset por fecha y filtro por ciudad + fechas
+        Index("ix_events_date_id", "date", "id"),
+        Index("ix_events_location_date_id", "location", "date", "id"),
+        # Búsqueda por nombre ILIKE '%term%' (pg_trgm)
+        Index(
+            "ix_events_name_trgm", "name",
+            postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, nullable=False)
     date = Column(DateTime, nullable=False)
     location = Column(String, nullable=False)
+    capacity = Column(Integer, nullable=True)  # Tickets generados para el evento
+    # Cancelado: no se vende ni se retiene ningún asiento (ver /admin/events/{id}/cancel)
+    is_cancelled = Column(Boolean, default=False, server_default=false(), nullable=False)
+
+    # Plano del recinto (NULL = asientos planos Seat-1..N)
+    venue_id = Column(Integer, ForeignKey("venues.id"), nullable=True, index=True)
     
     # Relación: Un evento tiene muchos tickets
     # (Asegúrate de que el string "Ticket" coincida con el nombre de la clase en ticket.py)
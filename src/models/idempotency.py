@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from src.database import Base
+
+class IdempotencyKey(Base):
+    """
+    Respuesta guardada de una petición con cabecera Idempotency-Key.
+
+    La fila se inserta y se completa dentro de la transacción de la propia
+    petición: solo es visible, con su respuesta, si el trabajo se confirmó.
+    Mientras tanto hace de lock entre réplicas (la repetición espera en el
+    INSERT). Los errores deshacen la transacción y con ella la clave.
+    """
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)  # sha256 de método + ruta + body
+    status_code = Column(Integer, nullable=True)
+    response = Column(JSONB, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # Borrado por lotes de las claves caducadas
+        Index("ix_idempotency_keys_created_at", "created_at"),
+    )
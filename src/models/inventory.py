@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, ForeignKey
+from src.database import Base
+
+class EventInventory(Base):
+    """
+    Contadores desnormalizados de disponibilidad por evento.
+
+    Cada evento tiene varias filas (shards): las compras concurrentes
+    actualizan un shard al azar en lugar de pelearse por una única fila
+    caliente. Los totales son la suma de los shards; un shard concreto
+    puede quedar en negativo sin que eso importe.
+    """
+    __tablename__ = "event_inventory"
+
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    available = Column(Integer, default=0, nullable=False)
+    locked = Column(Integer, default=0, nullable=False)
+    sold = Column(Integer, default=0, nullable=False)
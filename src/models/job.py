@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum, DateTime
+from sqlalchemy.sql import func
+import enum
+from src.database import Base
+
+class JobStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class TicketGenerationJob(Base):
+    """Generación de tickets en segundo plano para eventos muy grandes."""
+    __tablename__ = "ticket_generation_jobs"
+
+    id = Column(String, primary_key=True)  # uuid4 hex
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=False, index=True)
+    status = Column(Enum(JobStatus), default=JobStatus.PENDING, nullable=False)
+    total_tickets = Column(Integer, nullable=False)
+    generated_tickets = Column(Integer, default=0, nullable=False)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, BigInteger, Integer, String, Text, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func, text
+from src.database import Base
+
+class OutboxMessage(Base):
+    """
+    Mensajes pendientes de publicar en RabbitMQ (patrón transactional outbox).
+
+    Se escriben en la misma transacción que la compra, así que un mensaje
+    existe si y solo si la venta se confirmó. El relay los publica y borra.
+    Los que fallan se reintentan con backoff y, tras OUTBOX_MAX_ATTEMPTS,
+    quedan aparcados (parked_at) para revisarlos a mano.
+    """
+    __tablename__ = "outbox_messages"
+    __table_args__ = (
+        # Cola del relay: solo los mensajes no aparcados entran en el índice
+        Index(
+            "ix_outbox_messages_due",
+            "next_attempt_at",
+            postgresql_where=text("parked_at IS NULL"),
+        ),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    queue = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    parked_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum, DateTime, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import enum
 from src.database import Base
 
@@ -11,6 +11,19 @@ class TicketStatus(str, enum.Enum):
 
 class Ticket(Base):
     __tablename__ = "tickets"
+    __table_args__ = (
+        # Búsqueda de asientos libres por evento ("mejor asiento disponible")
+        Index("ix_tickets_event_status_id", "event_id", "status", "id"),
+        # Compra filtrada por sección y búsqueda de asiento concreto
+        Index("ix_tickets_event_section_status", "event_id", "section", "status"),
+        Index("ix_tickets_event_seat", "event_id", "seat_number"),
+        # Barrido del reaper: solo las retenciones activas entran en el índice
+        Index(
+            "ix_tickets_locked_until",
+            "locked_until",
+            postgresql_where=text("status = 'LOCKED'"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
@@ -20,7 +33,15 @@ class Ticket(Base):
     # -------------------------------------------------
 
     seat_number = Column(String, nullable=False)
+    # Solo en eventos con plano de recinto
+    section = Column(String, nullable=True)
+    seat_row = Column(Integer, nullable=True)
     price = Column(Integer, nullable=False)
     status = Column(Enum(TicketStatus), default=TicketStatus.AVAILABLE)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    # --- RETENCIÓN (checkout en dos fases) ---
+    booking_id = Column(Integer, ForeignKey("bookings.id"), nullable=True, index=True)
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Enum as SqEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index, Enum as SqEnum
 from sqlalchemy.sql import func
 from src.database import Base
 import enum
@@ -9,6 +9,19 @@ class UserRole(str, enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Paginación keyset del listado admin (ORDER BY created_at DESC, id DESC)
+        Index("ix_users_created_at_id", "created_at", "id"),
+        # Búsqueda ILIKE '%term%' (requiere la extensión pg_trgm)
+        Index(
+            "ix_users_email_trgm", "email",
+            postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}
+        ),
+        Index(
+            "ix_users_full_name_trgm", "full_name",
+            postgresql_using="gin", postgresql_ops={"full_name": "gin_trgm_ops"}
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
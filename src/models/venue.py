@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from src.database import Base
+
+class Venue(Base):
+    """Plano de un recinto, reutilizable entre eventos."""
+    __tablename__ = "venues"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    sections = relationship(
+        "VenueSection", back_populates="venue",
+        cascade="all, delete-orphan", order_by="VenueSection.position"
+    )
+
+class VenueSection(Base):
+    __tablename__ = "venue_sections"
+    __table_args__ = (
+        UniqueConstraint("venue_id", "name", name="uq_venue_sections_venue_name"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    venue_id = Column(Integer, ForeignKey("venues.id"), nullable=False, index=True)
+    venue = relationship("Venue", back_populates="sections")
+
+    name = Column(String, nullable=False)           # Ej: "PISTA", "A", "VIP"
+    position = Column(Integer, nullable=False)      # Orden de la sección en el plano
+    rows = Column(Integer, nullable=False)
+    seats_per_row = Column(Integer, nullable=False)
+    price = Column(Integer, nullable=False)         # Precio de la sección (tier)
@@ -0,0 +1,17 @@
+import asyncio
+
+from src.rabbitmq_client import publisher
+from src.services.outbox_service import run_outbox_relay
+
+# Relay independiente: se pueden lanzar varios en paralelo (SKIP LOCKED).
+# python -m src.outbox_relay
+
+async def main():
+    print(" [*] Outbox relay publicando mensajes...")
+    try:
+        await run_outbox_relay()
+    finally:
+        await publisher.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,235 @@
+import base64
+import hashlib
+import hmac
+import json
+import math
+import os
+import re
+import time
+from dataclasses import dataclass
+
+from src.tokens import SECRET_KEY
+
+# memory: contadores en el proceso (cada réplica limita por su cuenta)
+# redis:  contadores compartidos entre réplicas (servidor compatible con Redis)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Detrás de un proxy/balanceador, la IP real viene en X-Forwarded-For. Con el
+# valor por defecto (false) detrás de un balanceador, todas las peticiones
+# llegan con la IP del balanceador y los límites por IP (auth, clientes sin
+# token) se comparten entre TODOS los clientes: activarlo en ese despliegue.
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+# Proxies propios delante de la API: cada uno añade una entrada por la DERECHA
+# de X-Forwarded-For, así que la IP del cliente es la N-ésima desde la derecha.
+# Lo que haya más a la izquierda lo pone el cliente y no es de fiar.
+RATE_LIMIT_TRUSTED_HOPS = int(os.getenv("RATE_LIMIT_TRUSTED_HOPS", "1"))
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+RATE_LIMIT_SHARD_MAXSIZE = int(os.getenv("RATE_LIMIT_SHARD_MAXSIZE", "50000"))
+
+# --- POLÍTICAS ---
+@dataclass(frozen=True)
+class RatePolicy:
+    """
+    `limit` peticiones cada `period` segundos (GCRA: se admite una ráfaga de
+    hasta `limit` y después el ritmo sostenido). `by` = "user" usa el `sub`
+    del JWT y cae a la IP sin token; "ip" usa siempre la IP.
+    """
+    name: str
+    methods: frozenset[str]
+    pattern: re.Pattern
+    limit: int
+    period: float
+    by: str = "user"
+
+    @property
+    def interval(self) -> float:
+        return self.period / self.limit
+
+    @property
+    def tolerance(self) -> float:
+        return self.period - self.interval
+
+def _policy(name: str, methods: str, pattern: str, default: str, by: str = "user") -> RatePolicy | None:
+    # Formato "peticiones/segundos", p. ej. RATE_LIMIT_AUTH=10/60; vacío = sin límite
+    raw = os.getenv(f"RATE_LIMIT_{name.upper()}", default)
+    if not raw:
+        return None
+    limit, period = raw.split("/")
+    return RatePolicy(
+        name=name,
+        methods=frozenset(methods.split(",")),
+        pattern=re.compile(pattern),
+        limit=int(limit),
+        period=float(period),
+        by=by,
+    )
+
+# La primera que encaja gana. Auth va por IP: bcrypt es caro y no hay token.
+POLICIES = [p for p in (
+    _policy("auth", "POST", r"^/auth/(token|register|refresh)$", "10/60", by="ip"),
+    _policy("purchase", "POST", r"^/(tickets/buy|events/\d+/buy|bookings/hold|queue/events/\d+/join)", "20/10"),
+    _policy("default", "GET,POST,PATCH,PUT,DELETE", r"^/", "100/1"),
+) if p is not None]
+
+# --- IDENTIDAD (sin base de datos) ---
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+_SECRET = SECRET_KEY.encode()
+
+def token_subject(authorization: bytes) -> str | None:
+    """
+    `sub` de un JWT HS256 comprobando solo la firma y la expiración (un HMAC,
+    unos µs). No sustituye a get_current_user: sirve para que un cliente no
+    pueda repartir sus peticiones entre identidades inventadas. Solo vale
+    el access token: refresh, QR o turnos de la cola no identifican la petición.
+    """
+    if not authorization.startswith(b"Bearer "):
+        return None
+    try:
+        header, payload, signature = authorization[7:].decode().split(".")
+        expected = hmac.new(_SECRET, f"{header}.{payload}".encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            return None
+        claims = json.loads(_b64decode(payload))
+        if claims.get("type") != "access" or claims.get("exp", 0) < time.time():
+            return None
+        return claims.get("sub")
+    except ValueError:
+        return None
+
+def client_ip(scope) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        # Varias cabeceras X-Forwarded-For equivalen a una sola concatenada
+        forwarded = [
+            ip.strip()
+            for name, value in scope["headers"] if name == b"x-forwarded-for"
+            for ip in value.decode(errors="replace").split(",")
+        ]
+        if len(forwarded) >= RATE_LIMIT_TRUSTED_HOPS > 0:
+            return forwarded[-RATE_LIMIT_TRUSTED_HOPS]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+# --- ALMACENES ---
+class MemoryRateStore:
+    """
+    GCRA en memoria: por clave solo se guarda el TAT (instante teórico de la
+    siguiente petición). Los dicts van en shards para que la limpieza de
+    claves vencidas recorra un shard cada vez y no todo el mapa.
+    """
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS, shard_maxsize: int = RATE_LIMIT_SHARD_MAXSIZE):
+        self._shards: list[dict[str, float]] = [{} for _ in range(shards)]
+        self._shard_maxsize = shard_maxsize
+
+    async def hit(self, key: str, policy: RatePolicy) -> float:
+        """0 si se admite; si no, segundos hasta poder reintentar."""
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        tat = shard.get(key, now)
+        if tat < now:
+            tat = now
+        wait = tat - now - policy.tolerance
+        if wait > 0:
+            return wait
+        if len(shard) >= self._shard_maxsize and key not in shard:
+            self._sweep(shard, now)
+        shard[key] = tat + policy.interval
+        return 0.0
+
+    @staticmethod
+    def _sweep(shard: dict[str, float], now: float):
+        # Una clave con TAT pasado equivale a no tener entrada
+        for key in [k for k, tat in shard.items() if tat <= now]:
+            del shard[key]
+
+class RedisRateStore:
+    # GCRA atómico con el reloj del servidor; devuelve ms de espera (0 = admitida)
+    _GCRA = """
+    local now_parts = redis.call('TIME')
+    local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+    local interval = tonumber(ARGV[1])
+    local tolerance = tonumber(ARGV[2])
+    local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+    if tat < now then tat = now end
+    local wait = tat - now - tolerance
+    if wait > 0 then return wait end
+    local new_tat = tat + interval
+    redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+    return 0
+    """
+
+    def __init__(self, url: str):
+        # Dependencia opcional: solo hace falta con RATE_LIMIT_BACKEND=redis
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+        self._gcra = self._redis.register_script(self._GCRA)
+
+    async def hit(self, key: str, policy: RatePolicy) -> float:
+        wait_ms = await self._gcra(
+            keys=[f"rl:{key}"],
+            args=[int(policy.interval * 1000), int(policy.tolerance * 1000)],
+        )
+        return int(wait_ms) / 1000
+
+if RATE_LIMIT_BACKEND == "redis":
+    rate_store = RedisRateStore(REDIS_URL)
+else:
+    rate_store = MemoryRateStore()
+
+# --- MIDDLEWARE ---
+class RateLimitMiddleware:
+    """
+    Middleware ASGI puro (sin BaseHTTPMiddleware, que añade una tarea y
+    copias del body por petición). Responde 429 con Retry-After.
+    """
+
+    def __init__(self, app, policies: list[RatePolicy] = POLICIES, store=None):
+        self.app = app
+        self.policies = policies
+        self.store = store or rate_store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+
+        policy = self._match(scope["method"], scope["path"])
+        if policy is None:
+            return await self.app(scope, receive, send)
+
+        identity = None
+        if policy.by == "user":
+            for name, value in scope["headers"]:
+                if name == b"authorization":
+                    subject = token_subject(value)
+                    identity = f"user:{subject}" if subject else None
+                    break
+        if identity is None:
+            identity = f"ip:{client_ip(scope)}"
+
+        wait = await self.store.hit(f"{policy.name}:{identity}", policy)
+        if wait > 0:
+            return await self._reject(send, wait)
+        return await self.app(scope, receive, send)
+
+    def _match(self, method: str, path: str) -> RatePolicy | None:
+        for policy in self.policies:
+            if method in policy.methods and policy.pattern.match(path):
+                return policy
+        return None
+
+    @staticmethod
+    async def _reject(send, wait: float):
+        body = json.dumps({"detail": "Demasiadas peticiones, inténtalo más tarde"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(wait)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
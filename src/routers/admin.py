@@ -1,10 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import List, Literal
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, func
 from src.database import get_db
 from src.models.ticket import Ticket, TicketStatus
 from src.security import get_current_admin # Usamos la nueva dependencia
 from src.models.user import User
+from src.services.inventory_service import adjust_inventory, invalidate_availability
+from src.schemas.ticket import BulkReleaseRequest
+from src.services.admin_service import release_tickets_bulk, count_releasable, cancel_event
+from src.services.event_service import invalidate_events_cache
+from src.services.export_service import attendees_query, sales_query, export_body
+from src.services.analytics_service import (
+    record_sales,
+    event_analytics,
+    daily_analytics,
+    rebuild_rollups
+)
+from src.hashing import stats as hash_pool_stats
+from src.services.dead_letter_service import (
+    peek_dead_letters,
+    replay_dead_letters,
+    purge_dead_letters
+)
 
 router = APIRouter()
 
@@ -17,27 +37,177 @@ async def release_ticket(
     """
     Permite a un administrador cancelar una compra y liberar el asiento.
     """
-    # 1. Buscar el ticket
-    result = await db.execute(select(Ticket).where(Ticket.id == ticket_id))
-    ticket = result.scalar_one_or_none()
+    # 1. Liberar solo si sigue vendido: UPDATE condicional, como en la compra.
+    # Dos liberaciones simultáneas no pueden ajustar los contadores dos veces.
+    result = await db.execute(
+        update(Ticket)
+        .where(Ticket.id == ticket_id, Ticket.status == TicketStatus.SOLD)
+        .values(status=TicketStatus.AVAILABLE, owner_id=None, updated_at=func.now())
+        .returning(Ticket.id, Ticket.event_id, Ticket.seat_number, Ticket.price, Ticket.status)
+        .execution_options(synchronize_session=False)
+    )
+    ticket = result.one_or_none()
 
-    if not ticket:
-        raise HTTPException(status_code=404, detail="Ticket no encontrado")
-
-    # 2. Verificar que esté vendido (no tiene sentido liberar uno disponible)
-    if ticket.status != TicketStatus.SOLD:
+    # 2. Nada liberado: distinguimos "no existe" de "no está vendido"
+    if ticket is None:
+        await db.rollback()
+        exists = await db.scalar(select(Ticket.id).where(Ticket.id == ticket_id))
+        if exists is None:
+            raise HTTPException(status_code=404, detail="Ticket no encontrado")
         raise HTTPException(status_code=400, detail="El ticket no está vendido, no se puede liberar")
 
-    # 3. Lógica de Reversa (Liberación)
-    ticket.status = TicketStatus.AVAILABLE
-    ticket.owner_id = None # Quitamos al dueño
-    
-    # Guardamos cambios
+    # 3. Contadores y analítica en la misma transacción
+    await adjust_inventory(db, ticket.event_id, available=1, sold=-1)
+    await record_sales(db, [ticket], released=True)
     await db.commit()
-    await db.refresh(ticket)
+    invalidate_availability(ticket.event_id)
 
     return {
         "msg": f"Ticket {ticket_id} liberado exitosamente por admin {admin_user.email}",
         "status": ticket.status,
         "seat": ticket.seat_number
-    }
\ No newline at end of file
+    }
+
+# --- OPERACIONES EN BLOQUE ---
+@router.post("/tickets/release")
+async def release_tickets(
+    release_in: BulkReleaseRequest,
+    dry_run: bool = Query(False, description="Solo contar, sin liberar nada"),
+    db: AsyncSession = Depends(get_db),
+    admin_user: User = Depends(get_current_admin)
+):
+    """
+    Libera en bloque tickets por lista de ids, por comprador y/o por evento
+    (p. ej. anular un lote fraudulento). Trabaja por tramos con UPDATE ...
+    RETURNING y encola un aviso por comprador afectado.
+    """
+    filters = dict(
+        ticket_ids=release_in.ticket_ids,
+        owner_id=release_in.owner_id,
+        event_id=release_in.event_id,
+        include_locked=release_in.include_locked,
+    )
+    if dry_run:
+        return await count_releasable(db, **filters)
+    return await release_tickets_bulk(
+        db, reason=release_in.reason, notify=release_in.notify, **filters
+    )
+
+@router.post("/events/{event_id}/cancel")
+async def cancel_event_sales(
+    event_id: int,
+    dry_run: bool = Query(False, description="Solo contar, sin cancelar nada"),
+    db: AsyncSession = Depends(get_db),
+    admin_user: User = Depends(get_current_admin)
+):
+    """Cancela el evento: cierra la venta y libera vendidos y retenidos."""
+    result = await cancel_event(db, event_id, dry_run=dry_run)
+    if not dry_run:
+        invalidate_events_cache()
+    return result
+
+# --- EXPORTACIONES (streaming) ---
+def _export_response(query, filename: str, fmt: str, compress: bool) -> StreamingResponse:
+    body, media_type = export_body(query, fmt, compress)
+    filename = f"{filename}.{fmt}" + (".gz" if compress else "")
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/exports/events/{event_id}/attendees")
+async def export_attendees(
+    event_id: int,
+    format: Literal["csv", "ndjson"] = "csv",
+    gzip: bool = False,
+    ticket_status: List[TicketStatus] = Query([TicketStatus.SOLD], alias="status"),
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    admin_user: User = Depends(get_current_admin)
+):
+    """
+    Lista de asistentes del evento. Se envía según se lee de un cursor del
+    servidor: la memoria no crece con el tamaño del evento.
+    """
+    query = attendees_query(event_id, ticket_status, date_from, date_to)
+    return _export_response(query, f"attendees-{event_id}", format, gzip)
+
+@router.get("/exports/sales")
+async def export_sales(
+    format: Literal["csv", "ndjson"] = "csv",
+    gzip: bool = False,
+    event_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    admin_user: User = Depends(get_current_admin)
+):
+    """Informe de ventas (tickets vendidos), opcionalmente de un evento y rango de fechas."""
+    query = sales_query(event_id, date_from, date_to)
+    suffix = f"-{event_id}" if event_id is not None else ""
+    return _export_response(query, f"sales{suffix}", format, gzip)
+
+# --- ANALÍTICA DE VENTAS (desde los rollups, nunca desde tickets) ---
+@router.get("/analytics/events/{event_id}")
+async def read_event_analytics(
+    event_id: int,
+    bucket: Literal["minute", "hour", "day"] = "hour",
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    db: AsyncSession = Depends(get_db),
+    admin_user: User = Depends(get_current_admin)
+):
+    """Ingresos, sell-through y velocidad de venta del evento por minuto/hora/día."""
+    analytics = await event_analytics(db, event_id, bucket, date_from, date_to)
+    if analytics is None:
+        raise HTTPException(status_code=404, detail="Evento no encontrado")
+    return analytics
+
+@router.get("/analytics/daily")
+async def read_daily_analytics(
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    event_id: int | None = None,
+    db: AsyncSession = Depends(get_db),
+    admin_user: User = Depends(get_current_admin)
+):
+    """Ventas por día y evento (por defecto, los últimos 30 días)."""
+    return await daily_analytics(db, date_from, date_to, event_id)
+
+@router.post("/analytics/events/{event_id}/rebuild")
+async def rebuild_event_analytics(
+    event_id: int,
+    db: AsyncSession = Depends(get_db),
+    admin_user: User = Depends(get_current_admin)
+):
+    """Recalcula los rollups de un evento desde tickets (eventos anteriores a la analítica)."""
+    buckets = await rebuild_rollups(db, event_id)
+    return {"msg": "Analítica recalculada", "event_id": event_id, "buckets": buckets}
+
+@router.get("/metrics/hashing")
+async def hashing_metrics(admin_user: User = Depends(get_current_admin)):
+    """Cola y latencia del pool de bcrypt."""
+    return hash_pool_stats.as_dict()
+
+# --- DEAD LETTERS DEL WORKER ---
+@router.get("/dead-letters")
+async def list_dead_letters(
+    limit: int = Query(50, ge=1, le=500),
+    admin_user: User = Depends(get_current_admin)
+):
+    """Mensajes que el worker no pudo procesar (no se consumen al leerlos)."""
+    return await peek_dead_letters(limit)
+
+@router.post("/dead-letters/replay")
+async def replay_dead_letter_messages(
+    limit: int = Query(1000, ge=1, le=100_000),
+    admin_user: User = Depends(get_current_admin)
+):
+    """Reenvía en bloque mensajes de la DLQ a la cola principal."""
+    replayed = await replay_dead_letters(limit)
+    return {"msg": f"{replayed} mensajes reenviados", "replayed": replayed}
+
+@router.delete("/dead-letters")
+async def purge_dead_letter_messages(admin_user: User = Depends(get_current_admin)):
+    purged = await purge_dead_letters()
+    return {"msg": f"{purged} mensajes eliminados", "purged": purged}
@@ -1,21 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 from pydantic import BaseModel
 
 from src.database import get_db
 from src.models.user import User
 from src.schemas.user import UserCreate # Importamos del schema centralizado
 from src.security import (
-    verify_password, 
     create_access_token, 
     create_refresh_token, 
-    get_password_hash,
     verify_refresh_token,
     get_token_hash,
     get_current_user
 )
+from src.auth_cache import invalidate_sessions
+from src.hashing import hash_password, verify_and_update_password
 
 router = APIRouter()
 
@@ -37,7 +37,7 @@ async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
     # Crear usuario
     new_user = User(
         email=user_in.email, 
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await hash_password(user_in.password),
         full_name=user_in.full_name,
         phone_number=user_in.phone_number
     )
@@ -50,18 +50,28 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     result = await db.execute(select(User).where(User.email == form_data.username))
     user = result.scalar_one_or_none()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await verify_and_update_password(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuario o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # Rehash transparente si cambió el coste de bcrypt (se guarda con el login)
+    if new_hash:
+        user.hashed_password = new_hash
     
     access_token = create_access_token(data={"sub": user.email})
     refresh_token = create_refresh_token(data={"sub": user.email})
     
+    # Single Session: la sesión anterior deja de valer también en caché
+    previous_token_hash = user.active_token_hash
     user.active_token_hash = get_token_hash(access_token)
     await db.commit()
+    await invalidate_sessions(db, previous_token_hash)
     
     return {
         "access_token": access_token, 
@@ -81,8 +91,10 @@ async def refresh_access_token(request: RefreshTokenRequest, db: AsyncSession =
 
     new_access_token = create_access_token(data={"sub": user.email})
     
+    previous_token_hash = user.active_token_hash
     user.active_token_hash = get_token_hash(new_access_token)
     await db.commit()
+    await invalidate_sessions(db, previous_token_hash)
     
     return {
         "access_token": new_access_token,
@@ -93,6 +105,13 @@ async def refresh_access_token(request: RefreshTokenRequest, db: AsyncSession =
 @router.post("/logout")
 async def logout(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
     """Invalida la sesión actual en el servidor."""
-    current_user.active_token_hash = None
+    # current_user puede venir de la caché (fuera de la sesión): UPDATE directo
+    await db.execute(
+        update(User)
+        .where(User.id == current_user.id)
+        .values(active_token_hash=None)
+        .execution_options(synchronize_session=False)
+    )
     await db.commit()
+    await invalidate_sessions(db, current_user.active_token_hash)
     return {"msg": "Sesión cerrada. Token invalidado."}
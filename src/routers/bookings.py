@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database import get_db
+from src.schemas.booking import HoldRequest
+from src.services.booking_service import (
+    hold_tickets_service,
+    confirm_booking_service,
+    cancel_booking_service
+)
+from src.security import get_current_user
+from src.models.user import User
+from src.waiting_room import Admission, get_admission
+
+router = APIRouter()
+
+@router.post("/hold", status_code=status.HTTP_201_CREATED)
+async def hold_tickets(
+    hold_in: HoldRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    admission: Admission = Depends(get_admission)
+):
+    """
+    Retiene asientos mientras el usuario paga. Vencen solos si no se confirman.
+    """
+    await admission.require_tickets(db, hold_in.ticket_ids)
+    booking_id, expires_at, held_tickets = await hold_tickets_service(
+        hold_in.ticket_ids, current_user.id, db,
+        blocked_event_ids=admission.blocked_event_ids
+    )
+    return {
+        "booking_id": booking_id,
+        "expires_at": expires_at,
+        "tickets": [
+            {"id": t.id, "seat": t.seat_number, "price": t.price} for t in held_tickets
+        ]
+    }
+
+@router.post("/{booking_id}/confirm")
+async def confirm_booking(
+    booking_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    sold_tickets = await confirm_booking_service(
+        booking_id, current_user.id, db, email=current_user.email
+    )
+
+    return {"status": "success", "booking_id": booking_id, "tickets": [t.id for t in sold_tickets]}
+
+@router.post("/{booking_id}/cancel")
+async def cancel_booking(
+    booking_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    released_ids = await cancel_booking_service(booking_id, current_user.id, db)
+    return {"status": "cancelled", "booking_id": booking_id, "released": released_ids}
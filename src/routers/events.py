@@ -1,25 +1,228 @@
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
+import os
 from src.database import get_db
-from src.schemas.event import EventCreate
-from src.services.event_service import create_event_with_tickets
+from src.schemas.event import EventCreate, EventPage, EventResponse, VenueCreate
+from src.services.event_service import (
+    create_event_with_tickets,
+    create_event_with_ticket_job,
+    create_venue,
+    get_venue,
+    get_ticket_job,
+    list_events,
+    get_event,
+    events_cache,
+    invalidate_events_cache,
+    planned_capacity,
+    ASYNC_TICKETS_THRESHOLD
+)
+from src.http_cache import CachedBody, conditional_response
+from src.pagination import encode_cursor, decode_cursor
+from src.services.ticket_service import buy_best_available_service
+from src.services.idempotency_service import run_idempotent
+from src.services.inventory_service import get_availability
 # Importamos la dependencia estricta
-from src.security import get_current_admin 
+from src.security import get_current_admin, get_current_user
 from src.models.user import User
+from src.waiting_room import Admission, get_admission
 
 router = APIRouter()
 
+# max-age para navegadores/CDN (la caché del proceso usa EVENTS_CACHE_TTL)
+EVENTS_HTTP_MAX_AGE = int(os.getenv("EVENTS_HTTP_MAX_AGE", "10"))
+
+def _naive_utc(value: datetime | None) -> datetime | None:
+    """events.date es 'timestamp without time zone' (UTC)."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+# --- CATÁLOGO (público) ---
+@router.get("/", response_model=EventPage)
+async def read_events(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor de la página anterior"),
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    location: str | None = None,
+    name: str | None = Query(None, min_length=3),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Catálogo de eventos por fecha. Respuestas cacheadas en el proceso y
+    servidas con ETag fuerte (If-None-Match -> 304) para que navegador y CDN
+    absorban las lecturas repetidas.
+    """
+    date_from, date_to = _naive_utc(date_from), _naive_utc(date_to)
+    key = ("list", limit, cursor, date_from, date_to, location, name)
+
+    async def load():
+        events = await list_events(
+            db, limit,
+            cursor=decode_cursor(cursor, datetime, int) if cursor else None,
+            date_from=date_from, date_to=date_to, location=location, name=name
+        )
+        next_cursor = None
+        if len(events) == limit:
+            next_cursor = encode_cursor(events[-1].date, events[-1].id)
+        return CachedBody({
+            "items": [EventResponse.model_validate(e).model_dump(mode="json") for e in events],
+            "next_cursor": next_cursor
+        })
+
+    cached = await events_cache.get_or_load(key, load)
+    return conditional_response(request, cached, EVENTS_HTTP_MAX_AGE)
+
 # Cambiamos 'get_current_user' por 'get_current_admin'
 @router.post("/create", status_code=status.HTTP_201_CREATED)
 async def create_event(
     event_in: EventCreate,
+    request: Request,
+    idempotency_key: str | None = Header(None, max_length=255),
     db: AsyncSession = Depends(get_db),
     current_admin: User = Depends(get_current_admin) # <--- Ahora solo entra Admin
 ):
     # Ya no necesitamos el if current_user.is_superuser... la dependencia lo hizo.
-    event = await create_event_with_tickets(event_in, db)
+    async def create(respond):
+        if await planned_capacity(event_in, db) > ASYNC_TICKETS_THRESHOLD:
+            # Eventos muy grandes (asientos planos o recinto): respondemos ya y
+            # generamos los tickets en segundo plano
+            await create_event_with_ticket_job(
+                event_in, db,
+                before_commit=lambda event, job: respond(status.HTTP_202_ACCEPTED, {
+                    "msg": "Evento creado, generando tickets en segundo plano",
+                    "id": event.id,
+                    "venue_id": event.venue_id,
+                    "total_tickets": job.total_tickets,
+                    "job_id": job.id,
+                    "job_url": f"/events/jobs/{job.id}"
+                })
+            )
+        else:
+            await create_event_with_tickets(
+                event_in, db,
+                before_commit=lambda event: respond(status.HTTP_201_CREATED, {
+                    "msg": "Evento creado por Administrador",
+                    "id": event.id,
+                    "venue_id": event.venue_id,
+                    "total_tickets": event.capacity
+                })
+            )
+        invalidate_events_cache()
+
+    # Un reintento con la misma Idempotency-Key no genera otro evento
+    return await run_idempotent(request, idempotency_key, current_admin.id, db, create)
+
+@router.post("/venues", status_code=status.HTTP_201_CREATED)
+async def create_venue_layout(
+    venue_in: VenueCreate,
+    db: AsyncSession = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    """Guarda un plano de recinto para crear eventos con `venue_id`."""
+    venue = await create_venue(venue_in, db)
+    await db.commit()
+    return {"msg": "Recinto creado", "id": venue.id, "capacity": venue_in.capacity}
+
+@router.get("/venues/{venue_id}")
+async def read_venue_layout(
+    venue_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    venue = await get_venue(venue_id, db)
+    if not venue:
+        raise HTTPException(status_code=404, detail="Recinto no encontrado")
     return {
-        "msg": "Evento creado por Administrador",
-        "id": event.id,
-        "total_tickets": event_in.total_tickets
-    }
\ No newline at end of file
+        "id": venue.id,
+        "name": venue.name,
+        "sections": [
+            {
+                "name": s.name,
+                "rows": s.rows,
+                "seats_per_row": s.seats_per_row,
+                "price": s.price
+            }
+            for s in venue.sections
+        ]
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_event_job(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    """Estado de la generación de tickets de un evento grande."""
+    job = await get_ticket_job(job_id, db)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return {
+        "job_id": job.id,
+        "event_id": job.event_id,
+        "status": job.status,
+        "generated_tickets": job.generated_tickets,
+        "total_tickets": job.total_tickets,
+        "error": job.error
+    }
+
+@router.get("/{event_id}", response_model=EventResponse)
+async def read_event(request: Request, event_id: int, db: AsyncSession = Depends(get_db)):
+    async def load():
+        event = await get_event(event_id, db)
+        if event is None:
+            return None
+        return CachedBody(EventResponse.model_validate(event).model_dump(mode="json"))
+
+    cached = await events_cache.get_or_load(("detail", event_id), load)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Evento no encontrado")
+    return conditional_response(request, cached, EVENTS_HTTP_MAX_AGE)
+
+@router.get("/{event_id}/availability")
+async def read_availability(event_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Asientos libres / retenidos / vendidos. Pensado para polling: se sirve
+    de los contadores del evento con caché TTL, nunca contando tickets.
+    """
+    availability = await get_availability(event_id, db)
+    if availability is None:
+        raise HTTPException(status_code=404, detail="Evento no encontrado")
+    return availability
+
+@router.post("/{event_id}/buy")
+async def buy_best_available(
+    event_id: int,
+    request: Request,
+    quantity: int = Query(1, ge=1, le=10),
+    min_price: int | None = Query(None, ge=0),
+    max_price: int | None = Query(None, ge=0),
+    section: str | None = Query(None),
+    idempotency_key: str | None = Header(None, max_length=255),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    admission: Admission = Depends(get_admission)
+):
+    """
+    Compra los mejores `quantity` asientos libres sin elegir ticket_id.
+    Si el evento tiene sala de espera, exige un turno admitido (X-Queue-Token).
+    """
+    admission.require(event_id)
+
+    async def buy(respond):
+        await buy_best_available_service(
+            event_id, current_user.id, quantity, db,
+            min_price=min_price, max_price=max_price, section=section,
+            email=current_user.email,
+            before_commit=lambda sold_tickets: respond(200, {
+                "status": "success",
+                "tickets": [
+                    {"id": t.id, "seat": t.seat_number, "section": t.section, "price": t.price}
+                    for t in sold_tickets
+                ]
+            })
+        )
+
+    return await run_idempotent(request, idempotency_key, current_user.id, db, buy)
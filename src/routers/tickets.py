@@ -1,33 +1,65 @@
-from fastapi import APIRouter, Depends, BackgroundTasks
+from fastapi import APIRouter, Depends, Header, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.database import get_db
-from src.services.ticket_service import buy_ticket_service
+from src.schemas.ticket import BatchPurchaseRequest
+from src.services.ticket_service import buy_ticket_service, buy_tickets_batch_service
+from src.services.idempotency_service import run_idempotent
 from src.security import get_current_user
-# Asumiendo que tienes una función helper para publicar en RabbitMQ
-from src.rabbitmq_client import publish_message 
+from src.waiting_room import Admission, get_admission
 
 router = APIRouter()
 
 @router.post("/buy/{ticket_id}")
 async def buy_ticket(
     ticket_id: int, 
-    background_tasks: BackgroundTasks, # FastAPI Background Tasks
+    request: Request,
+    idempotency_key: str | None = Header(None, max_length=255),
     db: AsyncSession = Depends(get_db),
-    current_user = Depends(get_current_user) # Tu dependencia de auth
+    current_user = Depends(get_current_user), # Tu dependencia de auth
+    admission: Admission = Depends(get_admission)
 ):
-    # 1. Ejecutar la lógica de negocio (Transacción DB)
-    sold_ticket = await buy_ticket_service(ticket_id, current_user.id, db)
-    
-    # 2. Si llegamos aquí, el ticket es nuestro.
-    # Ahora delegamos el envío de correo al Worker.
-    message_body = {
-        "email": current_user.email,
-        "ticket_id": sold_ticket.id,
-        "event": sold_ticket.event_name,
-        "type": "EMAIL_CONFIRMATION"
-    }
-    
-    # Usamos BackgroundTasks para no bloquear la respuesta HTTP mientras conectamos a Rabbit
-    background_tasks.add_task(publish_message, "eventscale_queue", message_body)
+    # Eventos con sala de espera sin turno: 403 antes de la transacción
+    await admission.require_tickets(db, [ticket_id])
 
-    return {"status": "success", "ticket": sold_ticket.id}
\ No newline at end of file
+    async def buy(respond):
+        # 1. Ejecutar la lógica de negocio (Transacción DB)
+        # El correo de confirmación queda en el outbox en la misma transacción;
+        # el relay lo publica en RabbitMQ (la respuesta no espera al broker).
+        await buy_ticket_service(
+            ticket_id, current_user.id, db, email=current_user.email,
+            blocked_event_ids=admission.blocked_event_ids,
+            before_commit=lambda sold_ticket: respond(200, {"status": "success", "ticket": sold_ticket.id})
+        )
+
+    # Un reintento con la misma Idempotency-Key devuelve la respuesta original
+    return await run_idempotent(request, idempotency_key, current_user.id, db, buy)
+
+@router.post("/buy-batch")
+async def buy_tickets_batch(
+    purchase_in: BatchPurchaseRequest,
+    request: Request,
+    idempotency_key: str | None = Header(None, max_length=255),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user),
+    admission: Admission = Depends(get_admission)
+):
+    """
+    Compra varios asientos (p. ej. un grupo) en una sola transacción: o se
+    venden todos o ninguno. Un único correo de confirmación con todas las entradas.
+    """
+    await admission.require_tickets(db, purchase_in.ticket_ids)
+
+    async def buy(respond):
+        await buy_tickets_batch_service(
+            purchase_in.ticket_ids, current_user.id, db, email=current_user.email,
+            blocked_event_ids=admission.blocked_event_ids,
+            before_commit=lambda sold_tickets: respond(200, {
+                "status": "success",
+                "tickets": [
+                    {"id": t.id, "seat": t.seat_number, "section": t.section, "price": t.price}
+                    for t in sold_tickets
+                ]
+            })
+        )
+
+    return await run_idempotent(request, idempotency_key, current_user.id, db, buy)
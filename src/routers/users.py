@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
+from sqlalchemy import select, or_, tuple_, func, text
 from typing import List
+from datetime import datetime
 
 from src.database import get_db
 from src.models.user import User
 from src.schemas.user import UserResponse, UserUpdateProfile, UserChangePassword, UserAdminUpdate
-from src.security import get_current_user, get_current_admin, get_password_hash, verify_password
+from src.security import get_current_user, get_current_admin
+from src.hashing import hash_password, verify_and_update_password
+from src.auth_cache import invalidate_sessions
+from src.pagination import encode_cursor, decode_cursor, like_pattern
 
 router = APIRouter()
 
@@ -22,14 +26,17 @@ async def update_own_profile(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    # current_user puede venir de la caché: cargamos la fila para modificarla
+    user = await db.get(User, current_user.id)
     if user_update.full_name is not None:
-        current_user.full_name = user_update.full_name
+        user.full_name = user_update.full_name
     if user_update.phone_number is not None:
-        current_user.phone_number = user_update.phone_number
+        user.phone_number = user_update.phone_number
     
     await db.commit()
-    await db.refresh(current_user)
-    return current_user
+    await db.refresh(user)
+    await invalidate_sessions(db, user.active_token_hash)
+    return user
 
 @router.post("/me/change-password")
 async def change_password(
@@ -37,35 +44,86 @@ async def change_password(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    if not verify_password(password_data.old_password, current_user.hashed_password):
+    # La caché no guarda el hash de la contraseña: cargamos la fila
+    user = await db.get(User, current_user.id)
+    valid, _ = await verify_and_update_password(password_data.old_password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=400, detail="Contraseña actual incorrecta")
     
     if password_data.old_password == password_data.new_password:
         raise HTTPException(status_code=400, detail="La nueva contraseña debe ser diferente")
 
-    current_user.hashed_password = get_password_hash(password_data.new_password)
+    user.hashed_password = await hash_password(password_data.new_password)
     await db.commit()
     return {"msg": "Contraseña actualizada exitosamente"}
 
 # --- ÁREA ADMIN ---
 
+# Con búsqueda, el total se cuenta solo hasta este tope
+SEARCH_COUNT_CAP = 10_000
+
 @router.get("/", response_model=List[UserResponse])
 async def list_users(
+    response: Response,
     skip: int = 0, 
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=100),
     search: str | None = Query(None, min_length=3),
+    cursor: str | None = Query(None, description="X-Next-Cursor de la página anterior"),
+    include_total: bool = False,
     db: AsyncSession = Depends(get_db),
     current_admin: User = Depends(get_current_admin)
 ):
-    query = select(User)
+    """
+    Listado paginado por cursor (created_at, id): cada página cuesta lo
+    mismo sin importar lo lejos que esté. La siguiente página se pide con el
+    cursor de la cabecera `X-Next-Cursor`; `skip` queda solo por compatibilidad.
+    """
+    filters = []
     if search:
-        search_filter = f"%{search}%"
-        query = query.where(
+        # ILIKE '%term%' resuelto con los índices trigram
+        search_filter = like_pattern(search)
+        filters.append(
             or_(User.email.ilike(search_filter), User.full_name.ilike(search_filter))
         )
-    query = query.offset(skip).limit(limit).order_by(User.created_at.desc())
+
+    query = select(User).where(*filters)
+    if cursor:
+        created_at, user_id = decode_cursor(cursor, datetime, int)
+        query = query.where(tuple_(User.created_at, User.id) < tuple_(created_at, user_id))
+    elif skip:
+        query = query.offset(skip)
+    query = query.order_by(User.created_at.desc(), User.id.desc()).limit(limit)
+
     result = await db.execute(query)
-    return result.scalars().all()
+    users = result.scalars().all()
+
+    if len(users) == limit:
+        last = users[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+
+    if include_total:
+        response.headers["X-Total-Count"] = await _estimate_user_count(db, filters)
+
+    return users
+
+async def _estimate_user_count(db: AsyncSession, filters: list) -> str:
+    """
+    Total aproximado sin count(*) sobre toda la tabla: sin filtros usamos la
+    estimación del planner (pg_class.reltuples); con búsqueda contamos hasta
+    SEARCH_COUNT_CAP ("10000+" si hay más).
+    """
+    if not filters:
+        estimate = await db.scalar(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'users'::regclass")
+        )
+        # -1 si la tabla nunca se ha analizado
+        if estimate is None or estimate < 0:
+            estimate = await db.scalar(select(func.count()).select_from(User))
+        return str(estimate)
+
+    capped = select(User.id).where(*filters).limit(SEARCH_COUNT_CAP + 1).subquery()
+    count = await db.scalar(select(func.count()).select_from(capped))
+    return f"{SEARCH_COUNT_CAP}+" if count > SEARCH_COUNT_CAP else str(count)
 
 @router.patch("/{user_id}/admin-update", response_model=UserResponse)
 async def admin_update_user(
@@ -90,4 +148,6 @@ async def admin_update_user(
         
     await db.commit()
     await db.refresh(user_to_edit)
+    # Rol y estado viajan en la caché de sesiones
+    await invalidate_sessions(db, user_to_edit.active_token_hash)
     return user_to_edit
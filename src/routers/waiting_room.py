@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, Header, Query, status
+from src.security import get_current_admin, get_current_user
+from src.models.user import User
+from src.waiting_room import open_room, close_room, join_room, status_from_token
+
+router = APIRouter()
+
+# --- COLA (usuarios) ---
+@router.post("/events/{event_id}/join")
+async def join_queue(event_id: int, current_user: User = Depends(get_current_user)):
+    """
+    Entra en la sala de espera del evento. Volver a entrar devuelve el mismo
+    turno. El `queue_token` se envía en la cabecera X-Queue-Token al comprar.
+    """
+    return await join_room(event_id, current_user.email)
+
+@router.get("/status")
+async def queue_status(x_queue_token: str = Header(...)):
+    """
+    Posición, turnos por delante y tiempo estimado. Pensado para polling:
+    solo verifica la firma del turno, sin base de datos.
+    """
+    return await status_from_token(x_queue_token)
+
+# --- GESTIÓN (admin) ---
+@router.post("/events/{event_id}/open", status_code=status.HTTP_201_CREATED)
+async def open_queue(
+    event_id: int,
+    rate: float = Query(..., gt=0, description="Turnos admitidos por segundo"),
+    burst: int = Query(0, ge=0, description="Turnos admitidos al abrir"),
+    current_admin: User = Depends(get_current_admin)
+):
+    """Abre la sala de espera: desde ahora las compras del evento exigen turno."""
+    room = await open_room(event_id, rate, burst)
+    return {"msg": "Sala de espera abierta", "event_id": event_id, "rate": room.rate, "burst": room.burst}
+
+@router.delete("/events/{event_id}")
+async def close_queue(event_id: int, current_admin: User = Depends(get_current_admin)):
+    """Cierra la sala de espera: la venta vuelve a ser libre."""
+    await close_room(event_id)
+    return {"msg": "Sala de espera cerrada", "event_id": event_id}
@@ -0,0 +1,34 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn
+
+from src.database import Base
+
+# `create_all` crea las tablas que faltan pero nunca altera una que ya existe.
+# Columnas añadidas después a tablas existentes (se crean si faltan):
+ADDED_COLUMNS = {
+    "tickets": ["section", "seat_row", "booking_id", "locked_until"],
+    "events": ["capacity", "venue_id", "is_cancelled"],
+    "outbox_messages": ["last_error", "next_attempt_at", "parked_at"],
+}
+
+def upgrade_schema(conn: Connection):
+    """
+    Paso de esquema idempotente tras `create_all` (se ejecuta en cada arranque):
+    ADD COLUMN IF NOT EXISTS para las columnas nuevas e índices que falten en
+    tablas ya existentes.
+    """
+    for table_name, column_names in ADDED_COLUMNS.items():
+        table = Base.metadata.tables[table_name]
+        for name in column_names:
+            column = table.c[name]
+            ddl = str(CreateColumn(column).compile(dialect=conn.dialect))
+            for fk in column.foreign_keys:
+                ddl += f" REFERENCES {fk.column.table.name} ({fk.column.name})"
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {ddl}"))
+
+    # Índices declarados en los modelos que no existen todavía (p. ej. los de
+    # tickets, events o users, tablas creadas antes de declararlos)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
@@ -0,0 +1,5 @@
+from pydantic import BaseModel, Field
+from typing import List
+
+class HoldRequest(BaseModel):
+    ticket_ids: List[int] = Field(..., min_length=1, max_length=10)
@@ -1,9 +1,66 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from datetime import datetime
+from typing import List, Optional
+
+# --- PLANO DEL RECINTO ---
+class SectionLayout(BaseModel):
+    name: str = Field(..., min_length=1, max_length=20)  # Ej: "PISTA", "A", "VIP"
+    rows: int = Field(..., ge=1, le=500)
+    seats_per_row: int = Field(..., ge=1, le=500)
+    price: int = Field(..., ge=0)                        # Precio de la sección
+
+class VenueCreate(BaseModel):
+    name: str
+    sections: List[SectionLayout] = Field(..., min_length=1, max_length=200)
+
+    @model_validator(mode="after")
+    def check_sections(self):
+        names = [s.name for s in self.sections]
+        if len(names) != len(set(names)):
+            raise ValueError("Los nombres de sección deben ser únicos")
+        if self.capacity > 500_000:
+            raise ValueError("El recinto supera el máximo de 500000 asientos")
+        return self
+
+    @property
+    def capacity(self) -> int:
+        return sum(s.rows * s.seats_per_row for s in self.sections)
+
+# --- EVENTO ---
+class EventResponse(BaseModel):
+    id: int
+    name: str
+    date: datetime
+    location: str
+    capacity: Optional[int] = None
+    venue_id: Optional[int] = None
+    is_cancelled: bool = False
+
+    class Config:
+        from_attributes = True
+
+class EventPage(BaseModel):
+    items: List[EventResponse]
+    next_cursor: Optional[str] = None
 
 class EventCreate(BaseModel):
     name: str
     date: datetime
     location: str
-    total_tickets: int  # ¿Cuántas entradas generar? (Ej: 100, 5000)
-    ticket_price: int   # Precio por entrada
\ No newline at end of file
+    # Opción 1: asientos planos Seat-1..N a precio único
+    total_tickets: Optional[int] = Field(None, ge=1, le=500_000)  # ¿Cuántas entradas generar? (Ej: 100, 5000)
+    ticket_price: Optional[int] = Field(None, ge=0)               # Precio por entrada
+    # Opción 2: plano de un recinto ya guardado (eventos recurrentes)
+    venue_id: Optional[int] = None
+    # Opción 3: plano nuevo, se guarda como recinto para reutilizarlo
+    venue: Optional[VenueCreate] = None
+
+    @model_validator(mode="after")
+    def check_seating(self):
+        flat = self.total_tickets is not None or self.ticket_price is not None
+        options = sum([flat, self.venue_id is not None, self.venue is not None])
+        if options != 1:
+            raise ValueError("Indica total_tickets + ticket_price, venue_id o venue (solo uno)")
+        if flat and (self.total_tickets is None or self.ticket_price is None):
+            raise ValueError("total_tickets y ticket_price van juntos")
+        return self
@@ -0,0 +1,20 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional
+
+class BatchPurchaseRequest(BaseModel):
+    ticket_ids: List[int] = Field(..., min_length=1, max_length=10)
+
+class BulkReleaseRequest(BaseModel):
+    # Filtros combinables (AND); al menos uno
+    ticket_ids: Optional[List[int]] = Field(None, min_length=1, max_length=100_000)
+    owner_id: Optional[int] = None
+    event_id: Optional[int] = None
+    include_locked: bool = False     # También las retenciones en curso
+    reason: str = Field("ADMIN_RELEASE", max_length=50)
+    notify: bool = True              # Avisar a los compradores afectados
+
+    @model_validator(mode="after")
+    def check_filters(self):
+        if self.ticket_ids is None and self.owner_id is None and self.event_id is None:
+            raise ValueError("Indica ticket_ids, owner_id o event_id")
+        return self
@@ -1,10 +1,8 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
-import os
 import hashlib
 
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -12,17 +10,18 @@ from sqlalchemy import select
 
 from src.database import get_db
 from src.models.user import User, UserRole
+from src.auth_cache import get_cached_user, cache_user, session_generation
+from src.hashing import pwd_context
+from src.tokens import SECRET_KEY, ALGORITHM
 
 # --- CONFIGURACIÓN ---
-SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey123")
-ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
 # --- UTILIDADES ---
+# Versiones síncronas (bloquean el hilo): en endpoints usar las de src/hashing.py
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -36,13 +35,13 @@ def get_token_hash(token: str) -> str:
 # --- GENERACIÓN DE TOKENS ---
 def create_access_token(data: dict):
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire, "type": "access"})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def create_refresh_token(data: dict):
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    expire = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire, "type": "refresh"})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
@@ -60,6 +59,11 @@ def verify_refresh_token(token: str):
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     """
     Valida Access Token y verifica Single Session.
+
+    La sesión válida se cachea por hash de token (ver src/auth_cache.py), así
+    que la mayoría de peticiones no consultan la tabla users. En caché, el
+    usuario devuelto es un objeto transitorio: los endpoints que lo modifican
+    deben cargarlo de la sesión (`db.get(User, current_user.id)`).
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -72,21 +76,30 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         token_type: str = payload.get("type")
+        token_exp: float = payload.get("exp")
         
         if email is None or token_type != "access":
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+
+    # 2. Caché de sesiones: solo guarda sesiones vigentes (hash == active_token_hash)
+    incoming_token_hash = get_token_hash(token)
+    cached_user = await get_cached_user(incoming_token_hash)
+    if cached_user is not None:
+        if not cached_user.is_active:
+            raise HTTPException(status_code=400, detail="Usuario inactivo")
+        return cached_user
         
-    # 2. Buscar usuario
+    # 3. Buscar usuario (la generación, antes: ver src/auth_cache.py)
+    generation = await session_generation(incoming_token_hash)
     result = await db.execute(select(User).where(User.email == email))
     user = result.scalar_one_or_none()
     
     if user is None:
         raise credentials_exception
         
-    # 3. VERIFICACIÓN DE SESIÓN ÚNICA
-    incoming_token_hash = get_token_hash(token)
+    # 4. VERIFICACIÓN DE SESIÓN ÚNICA
     if user.active_token_hash != incoming_token_hash:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -95,6 +108,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
 
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Usuario inactivo")
+
+    await cache_user(incoming_token_hash, user, token_exp, generation)
         
     return user
 
@@ -0,0 +1,234 @@
+import os
+from collections import defaultdict
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, func, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from fastapi import HTTPException
+
+from src.models.booking import Booking, BookingStatus
+from src.models.event import Event
+from src.models.ticket import Ticket, TicketStatus
+from src.models.user import User
+from src.services.inventory_service import adjust_inventory_for_tickets, invalidate_availability
+from src.services.outbox_service import enqueue_outbox
+from src.services.analytics_service import record_sales
+from src.services.ticket_service import NOTIFICATIONS_QUEUE
+
+# Tickets por transacción: acota cuántas filas quedan bloqueadas a la vez
+ADMIN_RELEASE_CHUNK = int(os.getenv("ADMIN_RELEASE_CHUNK", "1000"))
+
+def _any_of(column, values: list[int]):
+    # `col = ANY(:array)`: un solo parámetro aunque la lista sea enorme (IN
+    # gasta uno por valor y asyncpg no admite más de 32767)
+    return column == func.any(bindparam(None, values, type_=ARRAY(Integer)))
+
+def _release_filter(
+    ticket_ids: list[int] | None,
+    owner_id: int | None,
+    event_id: int | None,
+    include_locked: bool,
+) -> list:
+    statuses = [TicketStatus.SOLD, TicketStatus.LOCKED] if include_locked else [TicketStatus.SOLD]
+    conditions = [Ticket.status.in_(statuses)]
+    if ticket_ids is not None:
+        conditions.append(_any_of(Ticket.id, ticket_ids))
+    if owner_id is not None:
+        conditions.append(Ticket.owner_id == owner_id)
+    if event_id is not None:
+        conditions.append(Ticket.event_id == event_id)
+    return conditions
+
+def release_notice(email: str, reason: str, tickets) -> dict:
+    """Aviso al comprador de que sus entradas se han anulado."""
+    return {
+        "email": email,
+        "reason": reason,
+        "tickets": [
+            {
+                "ticket_id": t.id,
+                "event_id": t.event_id,
+                "event": t.event_name,
+                "seat": t.seat_number,
+                "price": t.price,
+            }
+            for t in tickets
+        ],
+        "type": "TICKETS_RELEASED"
+    }
+
+async def count_releasable(
+    db: AsyncSession,
+    ticket_ids: list[int] | None = None,
+    owner_id: int | None = None,
+    event_id: int | None = None,
+    include_locked: bool = False,
+) -> dict:
+    """Simulación (dry run): cuántos tickets y compradores se verían afectados."""
+    conditions = _release_filter(ticket_ids, owner_id, event_id, include_locked)
+    rows = (await db.execute(
+        select(
+            func.count().filter(Ticket.status == TicketStatus.SOLD).label("sold"),
+            func.count().filter(Ticket.status == TicketStatus.LOCKED).label("locked"),
+            # Solo los compradores (a los retenidos no se les avisa)
+            func.count(Ticket.owner_id.distinct()).filter(Ticket.status == TicketStatus.SOLD).label("owners"),
+        ).where(*conditions)
+    )).one()
+    return {
+        "dry_run": True,
+        "released": rows.sold + rows.locked,
+        "sold": rows.sold,
+        "locked": rows.locked,
+        "owners": rows.owners,
+    }
+
+async def release_tickets_bulk(
+    db: AsyncSession,
+    reason: str,
+    ticket_ids: list[int] | None = None,
+    owner_id: int | None = None,
+    event_id: int | None = None,
+    include_locked: bool = False,
+    notify: bool = True,
+    chunk_size: int = ADMIN_RELEASE_CHUNK,
+) -> dict:
+    """
+    Libera (vuelve a AVAILABLE) los tickets vendidos -y opcionalmente los
+    retenidos- que cumplan los filtros.
+
+    Por tramos de `chunk_size`, cada uno en su transacción: un CTE bloquea
+    los candidatos en orden de id y un único UPDATE ... RETURNING los libera
+    devolviendo el estado y el dueño anteriores, con los que se ajustan los
+    contadores y se encola un aviso por comprador. Las reservas de los
+    tickets retenidos que se liberan pasan a CANCELLED en el mismo tramo.
+
+    Con `ticket_ids`, cada tramo envía solo sus ids (lista ordenada y
+    troceada), no la lista entera en cada vuelta.
+    """
+    totals = {"dry_run": False, "released": 0, "sold": 0, "locked": 0, "owners": 0, "chunks": 0}
+    notified_owners: set[int] = set()
+    touched_events: set[int] = set()
+
+    id_chunks = None
+    if ticket_ids is not None:
+        ids = sorted(set(ticket_ids))
+        id_chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+    conditions = _release_filter(None, owner_id, event_id, include_locked)
+
+    while True:
+        if id_chunks is not None:
+            if not id_chunks:
+                break
+            chunk_conditions = [*conditions, _any_of(Ticket.id, id_chunks.pop(0))]
+        else:
+            chunk_conditions = conditions
+
+        candidates = (
+            select(Ticket.id, Ticket.status, Ticket.owner_id, Ticket.booking_id, User.email)
+            .outerjoin(User, User.id == Ticket.owner_id)
+            .where(*chunk_conditions)
+            .order_by(Ticket.id)
+            .limit(chunk_size)
+            .with_for_update(of=Ticket)
+            .cte("candidates")
+        )
+        result = await db.execute(
+            update(Ticket)
+            .where(Ticket.id == candidates.c.id, Ticket.event_id == Event.id)
+            .values(
+                status=TicketStatus.AVAILABLE,
+                owner_id=None,
+                booking_id=None,
+                locked_until=None,
+                updated_at=func.now(),
+            )
+            .returning(
+                Ticket.id,
+                Ticket.event_id,
+                Ticket.seat_number,
+                Ticket.price,
+                Event.name.label("event_name"),
+                candidates.c.status.label("previous_status"),
+                candidates.c.owner_id.label("previous_owner_id"),
+                candidates.c.booking_id.label("previous_booking_id"),
+                candidates.c.email.label("owner_email"),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        released = result.all()
+        if not released:
+            await db.rollback()
+            if id_chunks:
+                continue  # Tramo de ids sin nada que liberar: siguiente
+            break
+
+        sold = [t for t in released if t.previous_status == TicketStatus.SOLD]
+        locked = [t for t in released if t.previous_status == TicketStatus.LOCKED]
+        await adjust_inventory_for_tickets(db, [t.event_id for t in sold], available=1, sold=-1)
+        await adjust_inventory_for_tickets(db, [t.event_id for t in locked], available=1, locked=-1)
+        await record_sales(db, sold, released=True)
+
+        # Checkout en curso de los retenidos: la reserva ya no se puede pagar
+        booking_ids = sorted({t.previous_booking_id for t in locked if t.previous_booking_id is not None})
+        if booking_ids:
+            await db.execute(
+                update(Booking)
+                .where(_any_of(Booking.id, booking_ids), Booking.status == BookingStatus.PENDING)
+                .values(status=BookingStatus.CANCELLED, updated_at=func.now())
+                .execution_options(synchronize_session=False)
+            )
+
+        if notify:
+            by_owner = defaultdict(list)
+            for ticket in sold:
+                if ticket.owner_email is not None:
+                    by_owner[(ticket.previous_owner_id, ticket.owner_email)].append(ticket)
+            await enqueue_outbox(
+                db, NOTIFICATIONS_QUEUE,
+                [release_notice(email, reason, tickets) for (_, email), tickets in by_owner.items()]
+            )
+            notified_owners.update(owner for owner, _ in by_owner)
+
+        await db.commit()
+        event_ids = {t.event_id for t in released}
+        invalidate_availability(*event_ids)
+        touched_events |= event_ids
+
+        totals["released"] += len(released)
+        totals["sold"] += len(sold)
+        totals["locked"] += len(locked)
+        totals["chunks"] += 1
+        if id_chunks is None and len(released) < chunk_size:
+            break
+
+    totals["owners"] = len(notified_owners)
+    totals["event_ids"] = sorted(touched_events)
+    return totals
+
+async def cancel_event(db: AsyncSession, event_id: int, dry_run: bool = False) -> dict:
+    """
+    Cancela un evento: deja de venderse (Event.is_cancelled, comprobado en
+    los UPDATE de compra y retención) y se liberan vendidos y retenidos.
+    """
+    if dry_run:
+        exists = await db.scalar(select(Event.id).where(Event.id == event_id))
+        if exists is None:
+            raise HTTPException(status_code=404, detail="Evento no encontrado")
+        return await count_releasable(db, event_id=event_id, include_locked=True)
+
+    # Primero se cierra la venta (y se confirma), luego se libera por tramos
+    cancelled = await db.scalar(
+        update(Event)
+        .where(Event.id == event_id)
+        .values(is_cancelled=True)
+        .returning(Event.id)
+        .execution_options(synchronize_session=False)
+    )
+    if cancelled is None:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Evento no encontrado")
+    await db.commit()
+
+    return await release_tickets_bulk(
+        db, reason="EVENT_CANCELLED", event_id=event_id, include_locked=True
+    )
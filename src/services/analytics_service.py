@@ -0,0 +1,306 @@
+import asyncio
+import os
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, func, literal, text
+from sqlalchemy.dialects.postgresql import insert
+
+from src.cache import TTLCache
+from src.database import AsyncSessionLocal
+from src.models.analytics import SalesRollup
+from src.models.event import Event
+from src.models.ticket import Ticket, TicketStatus
+
+ANALYTICS_SHARDS = int(os.getenv("ANALYTICS_SHARDS", "8"))
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "15"))
+# Los minutos cerrados hace más de esto se compactan en el shard 0
+ANALYTICS_COMPACT_AFTER_SECONDS = int(os.getenv("ANALYTICS_COMPACT_AFTER_SECONDS", "120"))
+ANALYTICS_COMPACT_INTERVAL = int(os.getenv("ANALYTICS_COMPACT_INTERVAL", "60"))
+# Ventana para la velocidad de venta "actual"
+ANALYTICS_VELOCITY_WINDOW_MINUTES = int(os.getenv("ANALYTICS_VELOCITY_WINDOW_MINUTES", "15"))
+
+_BUCKET_MINUTES = {"minute": 1, "hour": 60, "day": 1440}
+
+analytics_cache = TTLCache(ttl=ANALYTICS_CACHE_TTL, maxsize=2000)
+
+def _upsert(rows: list[dict]):
+    return _add_on_conflict(insert(SalesRollup).values(rows))
+
+def _add_on_conflict(stmt):
+    """Si la fila (evento, minuto, shard) ya existe, se suma a ella."""
+    return stmt.on_conflict_do_update(
+        index_elements=[SalesRollup.event_id, SalesRollup.bucket, SalesRollup.shard],
+        set_={
+            "tickets_sold": SalesRollup.tickets_sold + stmt.excluded.tickets_sold,
+            "revenue": SalesRollup.revenue + stmt.excluded.revenue,
+            "tickets_released": SalesRollup.tickets_released + stmt.excluded.tickets_released,
+            "revenue_released": SalesRollup.revenue_released + stmt.excluded.revenue_released,
+        },
+    )
+
+# --- MANTENIMIENTO INCREMENTAL (dentro de la transacción de la venta) ---
+async def record_sales(db: AsyncSession, tickets, released: bool = False):
+    """
+    Suma a la ventana del minuto en curso los tickets vendidos (o liberados
+    con `released=True`). Recibe filas con `event_id` y `price`, p. ej. las
+    de un RETURNING. Un único INSERT ... ON CONFLICT, sin commit.
+    """
+    per_event = defaultdict(lambda: [0, 0])
+    for ticket in tickets:
+        per_event[ticket.event_id][0] += 1
+        per_event[ticket.event_id][1] += ticket.price
+    if not per_event:
+        return
+
+    bucket = func.date_trunc("minute", func.now())
+    shard = random.randrange(ANALYTICS_SHARDS)
+    count_key, revenue_key = (
+        ("tickets_released", "revenue_released") if released else ("tickets_sold", "revenue")
+    )
+    rows = [
+        {
+            "event_id": event_id,
+            "bucket": bucket,
+            "shard": shard,
+            "tickets_sold": 0,
+            "revenue": 0,
+            "tickets_released": 0,
+            "revenue_released": 0,
+            count_key: count,
+            revenue_key: revenue,
+        }
+        # Orden fijo: dos transacciones con varios eventos bloquean en el mismo orden
+        for event_id, (count, revenue) in sorted(per_event.items())
+    ]
+    await db.execute(_upsert(rows))
+
+async def compact_rollups(db: AsyncSession) -> int:
+    """Funde los shards de los minutos ya cerrados en el shard 0 (una sentencia)."""
+    cutoff = func.now() - text(f"interval '{ANALYTICS_COMPACT_AFTER_SECONDS} seconds'")
+    moved = (
+        delete(SalesRollup)
+        .where(SalesRollup.shard > 0, SalesRollup.bucket < cutoff)
+        .returning(
+            SalesRollup.event_id,
+            SalesRollup.bucket,
+            SalesRollup.tickets_sold,
+            SalesRollup.revenue,
+            SalesRollup.tickets_released,
+            SalesRollup.revenue_released,
+        )
+        .cte("moved")
+    )
+    merged = (
+        select(
+            moved.c.event_id,
+            moved.c.bucket,
+            literal(0).label("shard"),
+            func.sum(moved.c.tickets_sold),
+            func.sum(moved.c.revenue),
+            func.sum(moved.c.tickets_released),
+            func.sum(moved.c.revenue_released),
+        )
+        .group_by(moved.c.event_id, moved.c.bucket)
+    )
+    result = await db.execute(_add_on_conflict(
+        insert(SalesRollup).from_select(
+            ["event_id", "bucket", "shard", "tickets_sold", "revenue", "tickets_released", "revenue_released"],
+            merged,
+        )
+    ))
+    await db.commit()
+    return result.rowcount
+
+async def run_rollup_compaction(interval: int = ANALYTICS_COMPACT_INTERVAL):
+    """Bucle en segundo plano (se arranca desde el lifespan de la app)."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await compact_rollups(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            print(f" [analytics] Error compactando ventas: {exc!r}")
+        await asyncio.sleep(interval)
+
+async def rebuild_rollups(db: AsyncSession, event_id: int) -> int:
+    """
+    Recalcula las ventas de un evento desde tickets (eventos anteriores a los
+    rollups). Solo conoce lo vendido ahora: las liberaciones pasadas se pierden.
+    """
+    await db.execute(select(func.pg_advisory_xact_lock(event_id)))
+    # FOR SHARE sobre los tickets del evento, como en rebuild_inventory: toda
+    # venta o liberación (que llama a record_sales con sus tickets bloqueados)
+    # termina antes del DELETE y entra en el conteo; las siguientes esperan al
+    # commit y suman sobre los rollups ya reconstruidos.
+    await db.execute(
+        select(func.count()).select_from(
+            select(Ticket.id)
+            .where(Ticket.event_id == event_id)
+            .with_for_update(read=True)
+            .subquery()
+        )
+    )
+    await db.execute(delete(SalesRollup).where(SalesRollup.event_id == event_id))
+    bucket = func.date_trunc("minute", func.coalesce(Ticket.updated_at, func.now()))
+    sold = (
+        select(
+            Ticket.event_id,
+            bucket.label("bucket"),
+            literal(0).label("shard"),
+            func.count(),
+            func.sum(Ticket.price),
+            literal(0),
+            literal(0),
+        )
+        .where(Ticket.event_id == event_id, Ticket.status == TicketStatus.SOLD)
+        .group_by(Ticket.event_id, bucket)
+    )
+    result = await db.execute(_add_on_conflict(
+        insert(SalesRollup).from_select(
+            ["event_id", "bucket", "shard", "tickets_sold", "revenue", "tickets_released", "revenue_released"],
+            sold,
+        )
+    ))
+    await db.commit()
+    invalidate_analytics()
+    return result.rowcount
+
+def invalidate_analytics():
+    analytics_cache.clear()
+
+# --- CONSULTAS (/admin/analytics) ---
+def _aware(value: datetime | None) -> datetime | None:
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def _series_row(row, bucket: str) -> dict:
+    net_sold = row.sold - row.released
+    return {
+        "bucket": row.bucket.isoformat(),
+        "tickets_sold": row.sold,
+        "tickets_released": row.released,
+        "net_tickets": net_sold,
+        "revenue": row.revenue - row.revenue_released,
+        "velocity_per_minute": round(row.sold / _BUCKET_MINUTES[bucket], 3),
+    }
+
+async def event_analytics(
+    db: AsyncSession,
+    event_id: int,
+    bucket: str = "hour",
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+) -> dict | None:
+    """Serie temporal y totales de un evento, cacheados ANALYTICS_CACHE_TTL."""
+    date_from, date_to = _aware(date_from), _aware(date_to)
+
+    async def load():
+        event = (await db.execute(
+            select(Event.id, Event.name, Event.capacity, Event.is_cancelled).where(Event.id == event_id)
+        )).one_or_none()
+        if event is None:
+            return None
+
+        trunc = func.date_trunc(bucket, SalesRollup.bucket)
+        query = (
+            select(
+                trunc.label("bucket"),
+                func.sum(SalesRollup.tickets_sold).label("sold"),
+                func.sum(SalesRollup.revenue).label("revenue"),
+                func.sum(SalesRollup.tickets_released).label("released"),
+                func.sum(SalesRollup.revenue_released).label("revenue_released"),
+            )
+            .where(SalesRollup.event_id == event_id)
+            .group_by(trunc)
+            .order_by(trunc)
+        )
+        if date_from is not None:
+            query = query.where(SalesRollup.bucket >= date_from)
+        if date_to is not None:
+            query = query.where(SalesRollup.bucket < date_to)
+        series = [_series_row(row, bucket) for row in (await db.execute(query)).all()]
+
+        # Totales de todo el evento (no solo del rango pedido)
+        totals = (await db.execute(
+            select(
+                func.coalesce(func.sum(SalesRollup.tickets_sold - SalesRollup.tickets_released), 0),
+                func.coalesce(func.sum(SalesRollup.revenue - SalesRollup.revenue_released), 0),
+                func.coalesce(
+                    func.sum(SalesRollup.tickets_sold).filter(
+                        SalesRollup.bucket >= func.now()
+                        - text(f"interval '{ANALYTICS_VELOCITY_WINDOW_MINUTES} minutes'")
+                    ),
+                    0,
+                ),
+            ).where(SalesRollup.event_id == event_id)
+        )).one()
+        net_tickets, net_revenue, recent_sold = totals
+
+        return {
+            "event_id": event.id,
+            "name": event.name,
+            "is_cancelled": event.is_cancelled,
+            "capacity": event.capacity,
+            "tickets_sold": net_tickets,
+            "revenue": net_revenue,
+            "sell_through": round(net_tickets / event.capacity, 4) if event.capacity else None,
+            "velocity_per_minute": round(recent_sold / ANALYTICS_VELOCITY_WINDOW_MINUTES, 3),
+            "bucket": bucket,
+            "series": series,
+        }
+
+    key = ("event", event_id, bucket, date_from, date_to)
+    return await analytics_cache.get_or_load(key, load)
+
+async def daily_analytics(
+    db: AsyncSession,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    event_id: int | None = None,
+) -> list[dict]:
+    """Ingresos y entradas por día y evento (por defecto, los últimos 30 días)."""
+    key = ("daily", _aware(date_from), _aware(date_to), event_id)
+
+    async def load():
+        # Los valores por defecto se calculan aquí para que `now` no entre en la clave
+        end = _aware(date_to) or datetime.now(timezone.utc)
+        start = _aware(date_from) or end - timedelta(days=30)
+        day = func.date_trunc("day", SalesRollup.bucket)
+        query = (
+            select(
+                day.label("day"),
+                SalesRollup.event_id,
+                Event.name,
+                Event.capacity,
+                func.sum(SalesRollup.tickets_sold).label("sold"),
+                func.sum(SalesRollup.revenue).label("revenue"),
+                func.sum(SalesRollup.tickets_released).label("released"),
+                func.sum(SalesRollup.revenue_released).label("revenue_released"),
+            )
+            .join(Event, Event.id == SalesRollup.event_id)
+            .where(SalesRollup.bucket >= start, SalesRollup.bucket < end)
+            .group_by(day, SalesRollup.event_id, Event.name, Event.capacity)
+            .order_by(day, SalesRollup.event_id)
+        )
+        if event_id is not None:
+            query = query.where(SalesRollup.event_id == event_id)
+        return [
+            {
+                "day": row.day.date().isoformat(),
+                "event_id": row.event_id,
+                "event": row.name,
+                "tickets_sold": row.sold,
+                "tickets_released": row.released,
+                "revenue": row.revenue - row.revenue_released,
+                "sell_through": round((row.sold - row.released) / row.capacity, 4) if row.capacity else None,
+                "velocity_per_minute": round(row.sold / _BUCKET_MINUTES["day"], 3),
+            }
+            for row in (await db.execute(query)).all()
+        ]
+
+    return await analytics_cache.get_or_load(key, load)
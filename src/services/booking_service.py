@@ -0,0 +1,291 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, insert, func
+from fastapi import HTTPException
+
+from src.database import AsyncSessionLocal
+from src.models.booking import Booking, BookingStatus
+from src.models.event import Event
+from src.models.ticket import Ticket, TicketStatus
+from src.services.inventory_service import adjust_inventory_for_tickets, invalidate_availability
+from src.services.outbox_service import enqueue_outbox
+from src.services.analytics_service import record_sales
+from src.services.ticket_service import NOTIFICATIONS_QUEUE, confirmation_message
+
+HOLD_TTL_SECONDS = int(os.getenv("HOLD_TTL_SECONDS", "600"))
+REAPER_INTERVAL_SECONDS = int(os.getenv("HOLD_REAPER_INTERVAL_SECONDS", "30"))
+
+async def hold_tickets_service(
+    ticket_ids: list[int],
+    user_id: int,
+    db: AsyncSession,
+    blocked_event_ids: frozenset[int] = frozenset(),
+):
+    """
+    Fase 1 del checkout: retiene los asientos (LOCKED) con vencimiento.
+    Los tickets de `blocked_event_ids` (sala de espera sin turno) no se retienen.
+
+    No queda ninguna transacción abierta durante el pago: la retención vive
+    en la fila del ticket (`locked_until`) y la libera el reaper si vence.
+    """
+    ticket_ids = sorted(set(ticket_ids))
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=HOLD_TTL_SECONDS)
+
+    # 1. Crear la reserva
+    booking_id = await db.scalar(
+        insert(Booking)
+        .values(
+            user_id=user_id,
+            status=BookingStatus.PENDING,
+            ticket_count=len(ticket_ids),
+            expires_at=expires_at,
+        )
+        .returning(Booking.id)
+    )
+
+    # 2. Bloquear en orden de id (evita deadlocks entre retenciones solapadas)
+    candidates = (
+        select(Ticket.id)
+        .join(Event, Event.id == Ticket.event_id)
+        .where(
+            Ticket.id.in_(ticket_ids),
+            Ticket.status == TicketStatus.AVAILABLE,
+            Event.is_cancelled.is_(False),
+        )
+        .order_by(Ticket.id)
+        .with_for_update(of=Ticket)
+    )
+    if blocked_event_ids:
+        candidates = candidates.where(Ticket.event_id.notin_(blocked_event_ids))
+    candidates = candidates.cte("candidates")
+    result = await db.execute(
+        update(Ticket)
+        .where(Ticket.id == candidates.c.id)
+        .values(
+            status=TicketStatus.LOCKED,
+            owner_id=user_id,
+            booking_id=booking_id,
+            locked_until=expires_at,
+            updated_at=func.now(),
+        )
+        .returning(Ticket.id, Ticket.event_id, Ticket.seat_number, Ticket.price)
+        .execution_options(synchronize_session=False)
+    )
+    held_tickets = result.all()
+
+    # 3. Todo o nada
+    if len(held_tickets) < len(ticket_ids):
+        await db.rollback()
+        if blocked_event_ids:
+            gated = await db.scalar(
+                select(Ticket.id)
+                .where(Ticket.id.in_(ticket_ids), Ticket.event_id.in_(blocked_event_ids))
+                .limit(1)
+            )
+            if gated is not None:
+                raise HTTPException(
+                    status_code=403,
+                    detail="Este evento tiene sala de espera: entra en la cola (/queue) para comprar"
+                )
+        raise HTTPException(status_code=409, detail="Algunos tickets ya no están disponibles")
+
+    event_ids = [t.event_id for t in held_tickets]
+    await adjust_inventory_for_tickets(db, event_ids, available=-1, locked=1)
+    await db.commit()
+    invalidate_availability(*set(event_ids))
+
+    return booking_id, expires_at, held_tickets
+
+async def confirm_booking_service(
+    booking_id: int, user_id: int, db: AsyncSession, email: str | None = None
+):
+    """
+    Fase 2 del checkout: pasa los asientos retenidos a SOLD.
+
+    Orden de locks: primero los tickets (por id) y después la reserva, el
+    mismo que la liberación masiva de admin, para no bloquearse mutuamente.
+    """
+    # 1. LOCKED -> SOLD (solo si el evento sigue a la venta)
+    candidates = (
+        select(Ticket.id)
+        .where(
+            Ticket.booking_id == booking_id,
+            Ticket.owner_id == user_id,
+            Ticket.status == TicketStatus.LOCKED,
+        )
+        .order_by(Ticket.id)
+        .with_for_update()
+        .cte("candidates")
+    )
+    result = await db.execute(
+        update(Ticket)
+        .where(
+            Ticket.id == candidates.c.id,
+            Ticket.event_id == Event.id,
+            Event.is_cancelled.is_(False),
+        )
+        .values(status=TicketStatus.SOLD, locked_until=None, updated_at=func.now())
+        .returning(
+            Ticket.id,
+            Ticket.event_id,
+            Ticket.seat_number,
+            Ticket.price,
+            Event.name.label("event_name"),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    sold_tickets = result.all()
+
+    # 2. La reserva debe ser nuestra, seguir pendiente y no haber vencido
+    ticket_count = await db.scalar(
+        update(Booking)
+        .where(
+            Booking.id == booking_id,
+            Booking.user_id == user_id,
+            Booking.status == BookingStatus.PENDING,
+            Booking.expires_at > func.now(),
+        )
+        .values(status=BookingStatus.CONFIRMED, updated_at=func.now())
+        .returning(Booking.ticket_count)
+        .execution_options(synchronize_session=False)
+    )
+    if ticket_count is None:
+        await db.rollback()
+        await _raise_booking_not_pending(booking_id, user_id, db)
+
+    # El reaper (o una liberación de admin) pudo adelantarse, o el evento se canceló
+    if len(sold_tickets) < ticket_count:
+        await db.rollback()
+        cancelled = await db.scalar(
+            select(Ticket.id)
+            .join(Event, Event.id == Ticket.event_id)
+            .where(Ticket.booking_id == booking_id, Event.is_cancelled.is_(True))
+            .limit(1)
+        )
+        if cancelled is not None:
+            raise HTTPException(status_code=409, detail="El evento ha sido cancelado")
+        raise HTTPException(status_code=409, detail="La reserva ha expirado")
+
+    event_ids = [t.event_id for t in sold_tickets]
+    await adjust_inventory_for_tickets(db, event_ids, locked=-1, sold=1)
+    await record_sales(db, sold_tickets)
+    if email:
+        await enqueue_outbox(
+            db, NOTIFICATIONS_QUEUE, [confirmation_message(email, t) for t in sold_tickets]
+        )
+    await db.commit()
+    invalidate_availability(*set(event_ids))
+
+    return sold_tickets
+
+async def cancel_booking_service(booking_id: int, user_id: int, db: AsyncSession):
+    """Abandona el checkout y devuelve los asientos retenidos (tickets antes que reserva)."""
+    candidates = (
+        select(Ticket.id)
+        .where(
+            Ticket.booking_id == booking_id,
+            Ticket.owner_id == user_id,
+            Ticket.status == TicketStatus.LOCKED,
+        )
+        .order_by(Ticket.id)
+        .with_for_update()
+        .cte("candidates")
+    )
+    result = await db.execute(
+        update(Ticket)
+        .where(Ticket.id == candidates.c.id)
+        .values(
+            status=TicketStatus.AVAILABLE,
+            owner_id=None,
+            booking_id=None,
+            locked_until=None,
+            updated_at=func.now(),
+        )
+        .returning(Ticket.id, Ticket.event_id)
+        .execution_options(synchronize_session=False)
+    )
+    released = result.all()
+
+    cancelled = await db.scalar(
+        update(Booking)
+        .where(
+            Booking.id == booking_id,
+            Booking.user_id == user_id,
+            Booking.status == BookingStatus.PENDING,
+        )
+        .values(status=BookingStatus.CANCELLED, updated_at=func.now())
+        .returning(Booking.id)
+        .execution_options(synchronize_session=False)
+    )
+    if cancelled is None:
+        await db.rollback()
+        await _raise_booking_not_pending(booking_id, user_id, db)
+
+    event_ids = [t.event_id for t in released]
+    await adjust_inventory_for_tickets(db, event_ids, available=1, locked=-1)
+    await db.commit()
+    invalidate_availability(*set(event_ids))
+
+    return [t.id for t in released]
+
+async def _raise_booking_not_pending(booking_id: int, user_id: int, db: AsyncSession):
+    booking_status = await db.scalar(
+        select(Booking.status).where(Booking.id == booking_id, Booking.user_id == user_id)
+    )
+    if booking_status is None:
+        raise HTTPException(status_code=404, detail="Reserva no encontrada")
+    if booking_status == BookingStatus.PENDING:
+        raise HTTPException(status_code=409, detail="La reserva ha expirado")
+    raise HTTPException(status_code=409, detail=f"La reserva ya está {booking_status.value}")
+
+# --- REAPER ---
+async def release_expired_holds(db: AsyncSession) -> int:
+    """
+    Libera en bloque todas las retenciones vencidas.
+
+    Un único UPDATE sobre el índice parcial `ix_tickets_locked_until`, sin
+    recorrer reservas una a una.
+    """
+    result = await db.execute(
+        update(Ticket)
+        .where(Ticket.status == TicketStatus.LOCKED, Ticket.locked_until < func.now())
+        .values(
+            status=TicketStatus.AVAILABLE,
+            owner_id=None,
+            booking_id=None,
+            locked_until=None,
+            updated_at=func.now(),
+        )
+        .returning(Ticket.event_id)
+        .execution_options(synchronize_session=False)
+    )
+    event_ids = result.scalars().all()
+    await adjust_inventory_for_tickets(db, event_ids, available=1, locked=-1)
+
+    await db.execute(
+        update(Booking)
+        .where(Booking.status == BookingStatus.PENDING, Booking.expires_at < func.now())
+        .values(status=BookingStatus.EXPIRED, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    invalidate_availability(*set(event_ids))
+
+    return len(event_ids)
+
+async def run_hold_reaper(interval: int = REAPER_INTERVAL_SECONDS):
+    """Bucle en segundo plano (se arranca desde el lifespan de la app)."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                released = await release_expired_holds(db)
+            if released:
+                print(f" [reaper] {released} asientos liberados por retención vencida")
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            print(f" [reaper] Error liberando retenciones: {exc!r}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import aio_pika
+from fastapi import HTTPException
+from src.rabbitmq_client import publisher, MAIN_QUEUE, DEAD_LETTER_QUEUE
+
+# Mensajes que se leen/reenvían por tanda (se confirman en paralelo)
+REPLAY_CHUNK = 100
+
+def _channel():
+    if not publisher.started:
+        raise HTTPException(status_code=503, detail="RabbitMQ no disponible")
+    return publisher.dedicated_channel()
+
+def _decode(value):
+    return value.decode(errors="replace") if isinstance(value, bytes) else value
+
+def _describe(message: aio_pika.abc.AbstractIncomingMessage) -> dict:
+    try:
+        body = json.loads(message.body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        body = message.body.decode(errors="replace")
+    headers = message.headers or {}
+    return {
+        "body": body,
+        "attempts": headers.get("x-attempts"),
+        "last_error": _decode(headers.get("x-last-error")),
+        "redelivered": message.redelivered,
+    }
+
+async def _get_many(queue, limit: int, messages: list):
+    # Rellena la lista del llamador: si un get falla a medias, lo ya leído
+    # sigue a su alcance para devolverlo a la cola
+    while len(messages) < limit:
+        message = await queue.get(no_ack=False, fail=False)
+        if message is None:
+            break
+        messages.append(message)
+
+async def _requeue(messages: list):
+    """Devuelve a la DLQ los mensajes que no se llegaron a confirmar."""
+    for message in messages:
+        if message.processed:
+            continue
+        try:
+            await message.nack(requeue=True)
+        except Exception:
+            # Canal caído: al cerrarse, el broker los devuelve igualmente
+            pass
+
+async def peek_dead_letters(limit: int) -> list[dict]:
+    """Lee sin consumir: los mensajes vuelven a la DLQ al terminar."""
+    async with _channel() as channel:
+        queue = await channel.get_queue(DEAD_LETTER_QUEUE)
+        messages = []
+        try:
+            await _get_many(queue, limit, messages)
+            return [_describe(m) for m in messages]
+        finally:
+            await _requeue(messages)
+
+async def replay_dead_letters(limit: int) -> int:
+    """
+    Devuelve hasta `limit` mensajes de la DLQ a la cola principal con el
+    contador de intentos a cero. Cada mensaje se borra de la DLQ solo cuando
+    el broker confirma la copia.
+    """
+    replayed = 0
+    async with _channel() as channel:
+        queue = await channel.get_queue(DEAD_LETTER_QUEUE)
+        while replayed < limit:
+            messages = []
+            try:
+                await _get_many(queue, min(REPLAY_CHUNK, limit - replayed), messages)
+                if not messages:
+                    break
+                results = await asyncio.gather(*(
+                    channel.default_exchange.publish(
+                        aio_pika.Message(
+                            body=message.body,
+                            content_type=message.content_type,
+                            headers={"x-replayed": True},
+                            delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+                        ),
+                        routing_key=MAIN_QUEUE,
+                    )
+                    for message in messages
+                ), return_exceptions=True)
+                # Solo se borra de la DLQ lo que el broker confirmó
+                for message, result in zip(messages, results):
+                    if not isinstance(result, Exception):
+                        await message.ack()
+                        replayed += 1
+                errors = [r for r in results if isinstance(r, Exception)]
+                if errors:
+                    raise errors[0]
+            finally:
+                await _requeue(messages)
+    return replayed
+
+async def purge_dead_letters() -> int:
+    async with _channel() as channel:
+        queue = await channel.get_queue(DEAD_LETTER_QUEUE)
+        result = await queue.purge()
+    return result.message_count
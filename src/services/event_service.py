@@ -1,35 +1,355 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable
+
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, update, func, literal, cast, true, tuple_, text
+from sqlalchemy.orm import selectinload
+from fastapi import HTTPException
+from src.cache import TTLCache
+from src.database import AsyncSessionLocal
 from src.models.event import Event
+from src.models.job import TicketGenerationJob, JobStatus
 from src.models.ticket import Ticket, TicketStatus
-from src.schemas.event import EventCreate
+from src.models.venue import Venue, VenueSection
+from src.schemas.event import EventCreate, VenueCreate
+from src.services.inventory_service import init_inventory, adjust_inventory
+from src.pagination import like_pattern
+
+# A partir de este tamaño la generación se hace como job en segundo plano
+ASYNC_TICKETS_THRESHOLD = int(os.getenv("ASYNC_TICKETS_THRESHOLD", "20000"))
+# Filas por sentencia INSERT (y por transacción en los jobs)
+TICKET_CHUNK_SIZE = int(os.getenv("TICKET_CHUNK_SIZE", "50000"))
+# Un job sin progreso desde hace más de esto se da por muerto al arrancar
+TICKET_JOB_STALE_SECONDS = int(os.getenv("TICKET_JOB_STALE_SECONDS", "600"))
+
+# Referencias a los jobs en curso para que el GC no los cancele
+_running_jobs: set[asyncio.Task] = set()
+
+async def insert_ticket_range(db: AsyncSession, event_id: int, first: int, last: int, price: int):
+    """
+    Inserta los asientos Seat-{first}..Seat-{last} con un único
+    INSERT ... SELECT generate_series: las filas se generan dentro de
+    Postgres, sin instanciar objetos ORM ni enviar datos por la red.
+    """
+    seat = func.generate_series(first, last).table_valued("n").render_derived(name="seat")
+    rows = select(
+        literal(event_id),
+        func.concat("Seat-", seat.c.n),
+        literal(price),
+        cast(literal(TicketStatus.AVAILABLE.name), Ticket.status.type),
+    ).select_from(seat)
+    await db.execute(
+        insert(Ticket).from_select(["event_id", "seat_number", "price", "status"], rows)
+    )
+
+async def insert_venue_tickets(db: AsyncSession, event_id: int, venue_id: int) -> int:
+    """
+    Expande el plano del recinto en tickets (sección x fila x asiento).
+
+    Cada lote es un INSERT ... SELECT sobre venue_sections cruzado con dos
+    generate_series, así que los asientos se generan en Postgres sin crear un
+    objeto por asiento. Se insertan por orden de sección, fila y asiento: el
+    menor id es el mejor asiento, que es lo que usa la compra "best available".
+    Devuelve el número de tickets generados (0 si el recinto no existe).
+    """
+    total = 0
+    for positions in await venue_ticket_batches(db, venue_id):
+        total += await insert_venue_batch(db, event_id, venue_id, positions)
+    return total
+
+async def venue_ticket_batches(db: AsyncSession, venue_id: int) -> list[list[int]]:
+    """Secciones (por posición) agrupadas en lotes de como mucho TICKET_CHUNK_SIZE asientos."""
+    result = await db.execute(
+        select(VenueSection.position, VenueSection.rows * VenueSection.seats_per_row)
+        .where(VenueSection.venue_id == venue_id)
+        .order_by(VenueSection.position)
+    )
+    batches, current, current_size = [], [], 0
+    for position, seats in result.all():
+        if current and current_size + seats > TICKET_CHUNK_SIZE:
+            batches.append(current)
+            current, current_size = [], 0
+        current.append(position)
+        current_size += seats
+    if current:
+        batches.append(current)
+    return batches
+
+async def insert_venue_batch(db: AsyncSession, event_id: int, venue_id: int, positions: list[int]) -> int:
+    """Un INSERT ... SELECT con los asientos de un lote de secciones."""
+    seat_row = func.generate_series(1, VenueSection.rows).table_valued("n").render_derived(name="seat_row")
+    seat = func.generate_series(1, VenueSection.seats_per_row).table_valued("n").render_derived(name="seat")
+    rows = (
+        select(
+            literal(event_id),
+            func.concat(VenueSection.name, "-", seat_row.c.n, "-", seat.c.n),
+            VenueSection.price,
+            cast(literal(TicketStatus.AVAILABLE.name), Ticket.status.type),
+            VenueSection.name,
+            seat_row.c.n,
+        )
+        .select_from(VenueSection)
+        .join(seat_row, true())
+        .join(seat, true())
+        .where(
+            VenueSection.venue_id == venue_id,
+            VenueSection.position.between(positions[0], positions[-1]),
+        )
+        .order_by(VenueSection.position, seat_row.c.n, seat.c.n)
+    )
+    result = await db.execute(
+        insert(Ticket).from_select(
+            ["event_id", "seat_number", "price", "status", "section", "seat_row"], rows
+        )
+    )
+    return result.rowcount
+
+async def create_venue(venue_data: VenueCreate, db: AsyncSession) -> Venue:
+    """Guarda un plano de recinto (sin commit) para reutilizarlo en otros eventos."""
+    exists = await db.scalar(select(Venue.id).where(Venue.name == venue_data.name))
+    if exists is not None:
+        raise HTTPException(status_code=409, detail="Ya existe un recinto con ese nombre")
+
+    venue = Venue(
+        name=venue_data.name,
+        sections=[
+            VenueSection(
+                name=section.name,
+                position=position,
+                rows=section.rows,
+                seats_per_row=section.seats_per_row,
+                price=section.price
+            )
+            for position, section in enumerate(venue_data.sections)
+        ]
+    )
+    db.add(venue)
+    await db.flush()
+    return venue
+
+async def get_venue(venue_id: int, db: AsyncSession):
+    # Carga explícita de secciones (en async no hay lazy loading)
+    result = await db.execute(
+        select(Venue).options(selectinload(Venue.sections)).where(Venue.id == venue_id)
+    )
+    return result.scalar_one_or_none()
+
+async def planned_capacity(event_data: EventCreate, db: AsyncSession) -> int:
+    """
+    Entradas que generará el evento (plano, recinto nuevo o guardado). Valida
+    el recinto guardado antes de crear nada: 404 si no existe, 422 si no tiene
+    asientos (un venue_id inexistente sería además un error de FK).
+    """
+    if event_data.venue is not None:
+        return event_data.venue.capacity
+    if event_data.venue_id is not None:
+        venue = await get_venue(event_data.venue_id, db)
+        if venue is None:
+            raise HTTPException(status_code=404, detail="Recinto no encontrado")
+        capacity = sum(s.rows * s.seats_per_row for s in venue.sections)
+        if capacity == 0:
+            raise HTTPException(status_code=422, detail="El recinto no tiene asientos")
+        return capacity
+    return event_data.total_tickets
 
-async def create_event_with_tickets(event_data: EventCreate, db: AsyncSession):
-    # 1. Crear el Evento
+async def create_event_with_tickets(
+    event_data: EventCreate,
+    db: AsyncSession,
+    before_commit: Callable[..., Awaitable[None]] | None = None,
+):
+    # 1. Plano nuevo: se guarda como recinto reutilizable
+    venue_id = event_data.venue_id
+    if event_data.venue is not None:
+        venue = await create_venue(event_data.venue, db)
+        venue_id = venue.id
+    elif venue_id is not None:
+        await planned_capacity(event_data, db)
+
+    # 2. Crear el Evento
     new_event = Event(
         name=event_data.name,
         date=event_data.date,
-        location=event_data.location
+        location=event_data.location,
+        venue_id=venue_id
     )
     db.add(new_event)
     await db.flush()  # Esto asigna un ID al evento sin hacer commit final todavía
 
-    # 2. Generar la lista de Tickets en memoria
-    # Generamos tickets con asientos "A-1", "A-2", etc.
-    tickets_to_create = []
-    for i in range(1, event_data.total_tickets + 1):
-        ticket = Ticket(
-            event_id=new_event.id,
-            seat_number=f"Seat-{i}",
-            price=event_data.ticket_price,
-            status=TicketStatus.AVAILABLE
-        )
-        tickets_to_create.append(ticket)
+    # 3. Inserción Masiva en Postgres, por tramos acotados
+    if venue_id is None:
+        for first in range(1, event_data.total_tickets + 1, TICKET_CHUNK_SIZE):
+            last = min(first + TICKET_CHUNK_SIZE - 1, event_data.total_tickets)
+            await insert_ticket_range(db, new_event.id, first, last, event_data.ticket_price)
+        new_event.capacity = event_data.total_tickets
+    else:
+        new_event.capacity = await insert_venue_tickets(db, new_event.id, venue_id)
+
+    # 4. Contadores de disponibilidad
+    await init_inventory(db, new_event.id, new_event.capacity)
+
+    if before_commit is not None:
+        await before_commit(new_event)
+    await db.commit()
+
+    return new_event
+
+# --- EVENTOS GRANDES (JOB ASÍNCRONO) ---
+async def create_event_with_ticket_job(
+    event_data: EventCreate,
+    db: AsyncSession,
+    before_commit: Callable[..., Awaitable[None]] | None = None,
+):
+    """
+    Crea el evento y lanza la generación de tickets en segundo plano (asientos
+    planos o plano de recinto). El progreso queda en `ticket_generation_jobs`
+    (visible desde cualquier réplica).
+    """
+    capacity = await planned_capacity(event_data, db)
+    venue_id = event_data.venue_id
+    if event_data.venue is not None:
+        venue_id = (await create_venue(event_data.venue, db)).id
 
-    # 3. Inserción Masiva (Batch Insert)
-    # add_all es mucho más rápido que hacer un add() por cada ticket
-    db.add_all(tickets_to_create)
-    
+    new_event = Event(
+        name=event_data.name,
+        date=event_data.date,
+        location=event_data.location,
+        capacity=capacity,
+        venue_id=venue_id
+    )
+    db.add(new_event)
+    await db.flush()
+
+    job = TicketGenerationJob(
+        id=uuid.uuid4().hex,
+        event_id=new_event.id,
+        status=JobStatus.PENDING,
+        total_tickets=capacity,
+        generated_tickets=0
+    )
+    db.add(job)
+    # El stock se va sumando a medida que el job genera tickets
+    await init_inventory(db, new_event.id, 0)
+    if before_commit is not None:
+        await before_commit(new_event, job)
+    await db.commit()
+
+    task = asyncio.create_task(
+        _generate_tickets_job(job.id, new_event.id, capacity, event_data.ticket_price, venue_id)
+    )
+    _running_jobs.add(task)
+    task.add_done_callback(_running_jobs.discard)
+
+    return new_event, job
+
+async def _generate_tickets_job(
+    job_id: str, event_id: int, total: int, price: int | None, venue_id: int | None = None
+):
+    async with AsyncSessionLocal() as db:
+        try:
+            await _update_job(db, job_id, status=JobStatus.RUNNING)
+            await db.commit()
+
+            # Cada tramo se confirma junto con su progreso
+            if venue_id is None:
+                for first in range(1, total + 1, TICKET_CHUNK_SIZE):
+                    last = min(first + TICKET_CHUNK_SIZE - 1, total)
+                    await insert_ticket_range(db, event_id, first, last, price)
+                    await adjust_inventory(db, event_id, available=last - first + 1)
+                    await _update_job(db, job_id, generated_tickets=last)
+                    await db.commit()
+            else:
+                generated = 0
+                for positions in await venue_ticket_batches(db, venue_id):
+                    inserted = await insert_venue_batch(db, event_id, venue_id, positions)
+                    generated += inserted
+                    await adjust_inventory(db, event_id, available=inserted)
+                    await _update_job(db, job_id, generated_tickets=generated)
+                    await db.commit()
+
+            await _update_job(db, job_id, status=JobStatus.DONE)
+            await db.commit()
+        except Exception as exc:
+            await db.rollback()
+            await _update_job(db, job_id, status=JobStatus.FAILED, error=repr(exc))
+            await db.commit()
+
+async def fail_stale_ticket_jobs(db: AsyncSession) -> int:
+    """
+    Marca como FAILED los jobs PENDING/RUNNING sin progreso desde hace
+    TICKET_JOB_STALE_SECONDS: su proceso murió (reinicio, despliegue) y nadie
+    los va a terminar. Cada tramo actualiza `updated_at`, así que un job vivo
+    en otra réplica no entra. Se llama al arrancar la app.
+    """
+    stale = func.now() - text(f"interval '{TICKET_JOB_STALE_SECONDS} seconds'")
+    result = await db.execute(
+        update(TicketGenerationJob)
+        .where(
+            TicketGenerationJob.status.in_([JobStatus.PENDING, JobStatus.RUNNING]),
+            func.coalesce(TicketGenerationJob.updated_at, TicketGenerationJob.created_at) < stale,
+        )
+        .values(
+            status=JobStatus.FAILED,
+            error="Interrumpido: el proceso que lo generaba se detuvo",
+            updated_at=func.now(),
+        )
+        .execution_options(synchronize_session=False)
+    )
     await db.commit()
-    await db.refresh(new_event)
-    
-    return new_event
\ No newline at end of file
+    return result.rowcount
+
+async def _update_job(db: AsyncSession, job_id: str, **values):
+    await db.execute(
+        update(TicketGenerationJob)
+        .where(TicketGenerationJob.id == job_id)
+        .values(updated_at=func.now(), **values)
+        .execution_options(synchronize_session=False)
+    )
+
+async def get_ticket_job(job_id: str, db: AsyncSession):
+    result = await db.execute(
+        select(TicketGenerationJob).where(TicketGenerationJob.id == job_id)
+    )
+    return result.scalar_one_or_none()
+
+# --- CATÁLOGO ---
+EVENTS_CACHE_TTL = float(os.getenv("EVENTS_CACHE_TTL", "30"))
+
+# Páginas del listado (clave = filtros + cursor) y detalle por id
+events_cache = TTLCache(ttl=EVENTS_CACHE_TTL)
+
+def invalidate_events_cache():
+    """Tras crear o modificar eventos. Las páginas dependen de todo el catálogo."""
+    events_cache.clear()
+
+async def list_events(
+    db: AsyncSession,
+    limit: int,
+    cursor: tuple[datetime, int] | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    location: str | None = None,
+    name: str | None = None,
+):
+    """Eventos por fecha ascendente con paginación keyset sobre (date, id)."""
+    query = select(Event)
+    if date_from is not None:
+        query = query.where(Event.date >= date_from)
+    if date_to is not None:
+        query = query.where(Event.date < date_to)
+    if location is not None:
+        query = query.where(Event.location == location)
+    if name is not None:
+        query = query.where(Event.name.ilike(like_pattern(name)))
+    if cursor is not None:
+        query = query.where(tuple_(Event.date, Event.id) > tuple_(*cursor))
+    query = query.order_by(Event.date, Event.id).limit(limit)
+
+    result = await db.execute(query)
+    return result.scalars().all()
+
+async def get_event(event_id: int, db: AsyncSession):
+    result = await db.execute(select(Event).where(Event.id == event_id))
+    return result.scalar_one_or_none()
@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator
+
+from sqlalchemy import select, Select
+
+from src.database import AsyncSessionLocal
+from src.models.event import Event
+from src.models.ticket import Ticket, TicketStatus
+from src.models.user import User
+
+# Filas por viaje al cursor del servidor: la memoria depende de esto, no del evento
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+# --- CONSULTAS ---
+def attendees_query(
+    event_id: int,
+    statuses: list[TicketStatus],
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+) -> Select:
+    """Asistentes de un evento: un ticket por fila con los datos del comprador."""
+    query = (
+        select(
+            Ticket.id.label("ticket_id"),
+            Ticket.section,
+            Ticket.seat_row,
+            Ticket.seat_number.label("seat"),
+            Ticket.price,
+            Ticket.status,
+            Ticket.updated_at,
+            User.id.label("user_id"),
+            User.email,
+            User.full_name,
+            User.phone_number,
+        )
+        .outerjoin(User, User.id == Ticket.owner_id)
+        .where(Ticket.event_id == event_id, Ticket.status.in_(statuses))
+        # Recorre ix_tickets_event_status_id
+        .order_by(Ticket.id)
+    )
+    return _updated_between(query, date_from, date_to)
+
+def sales_query(
+    event_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+) -> Select:
+    """Ventas (tickets vendidos) con evento y comprador; fecha = última modificación."""
+    query = (
+        select(
+            Ticket.updated_at.label("sold_at"),
+            Ticket.id.label("ticket_id"),
+            Event.id.label("event_id"),
+            Event.name.label("event"),
+            Event.date.label("event_date"),
+            Ticket.section,
+            Ticket.seat_number.label("seat"),
+            Ticket.price,
+            User.email.label("buyer_email"),
+        )
+        .join(Event, Event.id == Ticket.event_id)
+        .outerjoin(User, User.id == Ticket.owner_id)
+        .where(Ticket.status == TicketStatus.SOLD)
+        .order_by(Ticket.id)
+    )
+    if event_id is not None:
+        query = query.where(Ticket.event_id == event_id)
+    return _updated_between(query, date_from, date_to)
+
+def _updated_between(query: Select, date_from: datetime | None, date_to: datetime | None) -> Select:
+    # tickets.updated_at es timestamptz: las fechas sin zona se toman como UTC
+    date_from, date_to = (
+        d.replace(tzinfo=timezone.utc) if d is not None and d.tzinfo is None else d
+        for d in (date_from, date_to)
+    )
+    if date_from is not None:
+        query = query.where(Ticket.updated_at >= date_from)
+    if date_to is not None:
+        query = query.where(Ticket.updated_at < date_to)
+    return query
+
+# --- STREAMING ---
+async def stream_rows(query: Select) -> AsyncIterator[list]:
+    """
+    Filas por lotes desde un cursor del servidor (asyncpg). Abre su propia
+    sesión: la de `get_db` se cierra antes de que empiece a enviarse el body
+    de un StreamingResponse.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for partition in result.partitions():
+            yield partition
+
+def _plain(value):
+    if isinstance(value, TicketStatus):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+async def encode_csv(query: Select) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(query.selected_columns.keys())
+    async for rows in stream_rows(query):
+        writer.writerows([_plain(v) for v in row] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # Cabecera sola si no hay filas
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+async def encode_ndjson(query: Select) -> AsyncIterator[bytes]:
+    keys = query.selected_columns.keys()
+    async for rows in stream_rows(query):
+        yield "".join(
+            json.dumps({k: _plain(v) for k, v in zip(keys, row)}, ensure_ascii=False) + "\n"
+            for row in rows
+        ).encode()
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Comprime al vuelo (formato gzip) sin acumular el fichero en memoria."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+ENCODERS = {
+    "csv": (encode_csv, "text/csv; charset=utf-8"),
+    "ndjson": (encode_ndjson, "application/x-ndjson"),
+}
+
+def export_body(query: Select, fmt: str, compress: bool) -> tuple[AsyncIterator[bytes], str]:
+    """(iterador del body, media type) listos para un StreamingResponse."""
+    encoder, media_type = ENCODERS[fmt]
+    body = encoder(query)
+    if compress:
+        return gzip_stream(body), "application/gzip"
+    return body, media_type
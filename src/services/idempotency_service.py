@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import os
+from typing import Awaitable, Callable
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, update, delete, func, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import AsyncSessionLocal
+from src.models.idempotency import IdempotencyKey
+
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_PURGE_BATCH = int(os.getenv("IDEMPOTENCY_PURGE_BATCH", "5000"))
+IDEMPOTENCY_PURGE_INTERVAL = int(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "300"))
+
+# El handler recibe `respond(status_code, contenido)` y debe llamarlo ANTES
+# del commit de su transacción (los servicios aceptan `before_commit`): así
+# la respuesta guardada y el trabajo se confirman o se pierden juntos.
+Respond = Callable[[int, dict], Awaitable[None]]
+Handler = Callable[[Respond], Awaitable[None]]
+
+# Peticiones repetidas que llegan a esta réplica mientras la original sigue
+# en curso: esperan su resultado en lugar de consultar la base de datos.
+_in_flight: dict[tuple[int, str], asyncio.Future] = {}
+
+async def request_fingerprint(request: Request) -> str:
+    body = await request.body()
+    raw = f"{request.method} {request.url.path}?{request.url.query}".encode() + b"\n" + body
+    return hashlib.sha256(raw).hexdigest()
+
+def _response(status_code: int, content: dict, replayed: bool) -> JSONResponse:
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return JSONResponse(status_code=status_code, content=content, headers=headers)
+
+async def run_idempotent(
+    request: Request, key: str | None, user_id: int, db: AsyncSession, handler: Handler
+) -> JSONResponse:
+    """
+    Ejecuta `handler` una sola vez por (usuario, Idempotency-Key). Las
+    repeticiones reciben la respuesta original con la cabecera
+    Idempotent-Replayed. Sin clave, se ejecuta sin más.
+    """
+    if key is None:
+        status_code, content = await _run_handler(handler, None)
+        return _response(status_code, content, replayed=False)
+
+    slot = (user_id, key)
+    fingerprint = await request_fingerprint(request)
+
+    # 1. Repetición concurrente en esta misma réplica
+    pending = _in_flight.get(slot)
+    if pending is not None:
+        stored_fingerprint, status_code, content = await asyncio.shield(pending)
+        _check_fingerprint(stored_fingerprint, fingerprint)
+        return _response(status_code, content, replayed=True)
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[slot] = future
+    try:
+        status_code, content, replayed = await _execute(slot, fingerprint, db, handler)
+        future.set_result((fingerprint, status_code, content))
+        return _response(status_code, content, replayed)
+    except BaseException as exc:
+        future.set_exception(exc)
+        # Nadie más la espera: evitamos el aviso "exception was never retrieved"
+        future.exception()
+        raise
+    finally:
+        del _in_flight[slot]
+
+async def _run_handler(handler: Handler, store: Respond | None) -> tuple[int, dict]:
+    response = None
+
+    async def respond(status_code: int, content: dict):
+        nonlocal response
+        response = (status_code, jsonable_encoder(content))
+        if store is not None:
+            await store(*response)
+
+    await handler(respond)
+    if response is None:
+        raise RuntimeError("El handler idempotente terminó sin llamar a respond()")
+    return response
+
+async def _execute(slot: tuple[int, str], fingerprint: str, db: AsyncSession, handler: Handler):
+    user_id, key = slot
+
+    # 2. Reclamar la clave en la MISMA transacción que el trabajo. Otra réplica
+    # con la misma clave espera en este INSERT hasta que terminemos: si
+    # confirmamos, encuentra la respuesta guardada; si la transacción se
+    # deshace (error, caída), la clave nunca existió y puede ejecutar ella.
+    # Una clave confirmada no se vuelve a reclamar nunca.
+    claimed = await db.scalar(
+        insert(IdempotencyKey)
+        .values(user_id=user_id, key=key, fingerprint=fingerprint)
+        .on_conflict_do_nothing(index_elements=[IdempotencyKey.user_id, IdempotencyKey.key])
+        .returning(IdempotencyKey.key)
+    )
+    if claimed is None:
+        stored = (await db.execute(
+            select(
+                IdempotencyKey.fingerprint,
+                IdempotencyKey.status_code,
+                IdempotencyKey.response,
+            ).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        )).one_or_none()
+        await db.rollback()
+        if stored is None:
+            # Caducada y borrada entre medias: el cliente puede reintentar
+            raise HTTPException(
+                status_code=409,
+                detail="Conflicto con la Idempotency-Key, vuelve a intentarlo",
+                headers={"Retry-After": "1"},
+            )
+        _check_fingerprint(stored.fingerprint, fingerprint)
+        if stored.status_code is None:
+            # Fila de una versión anterior que no llegó a guardar respuesta:
+            # el trabajo pudo confirmarse, así que no se repite
+            raise HTTPException(
+                status_code=409,
+                detail="La petición original con esta Idempotency-Key no guardó su respuesta"
+            )
+        return stored.status_code, stored.response, True
+
+    # 3. Ejecutar: la respuesta se escribe antes del commit del handler. Un
+    # error antes del commit deshace también la clave (queda libre).
+    async def store(status_code: int, content: dict):
+        await db.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .values(status_code=status_code, response=content)
+        )
+
+    status_code, content = await _run_handler(handler, store)
+    return status_code, content, False
+
+def _check_fingerprint(stored: str, current: str):
+    if stored != current:
+        raise HTTPException(
+            status_code=422,
+            detail="La Idempotency-Key ya se usó con otra petición distinta"
+        )
+
+# --- CADUCIDAD ---
+async def purge_expired_keys(batch_size: int = IDEMPOTENCY_PURGE_BATCH) -> int:
+    """Borra las claves caducadas por lotes (transacciones y locks cortos)."""
+    cutoff = func.now() - text(f"interval '{IDEMPOTENCY_TTL_HOURS} hours'")
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            expired = (
+                select(IdempotencyKey.user_id, IdempotencyKey.key)
+                .where(IdempotencyKey.created_at < cutoff)
+                .limit(batch_size)
+            )
+            result = await db.execute(
+                delete(IdempotencyKey)
+                .where(tuple_(IdempotencyKey.user_id, IdempotencyKey.key).in_(expired))
+            )
+            await db.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+
+async def run_idempotency_janitor(interval: int = IDEMPOTENCY_PURGE_INTERVAL):
+    """Bucle en segundo plano (se arranca desde el lifespan de la app)."""
+    while True:
+        try:
+            purged = await purge_expired_keys()
+            if purged:
+                print(f" [idempotency] {purged} claves caducadas borradas")
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            print(f" [idempotency] Error borrando claves caducadas: {exc!r}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,150 @@
+import os
+import random
+from collections import defaultdict
+from typing import Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, insert, func
+from src.cache import TTLCache
+from src.models.event import Event
+from src.models.inventory import EventInventory
+from src.models.ticket import Ticket, TicketStatus
+
+INVENTORY_SHARDS = int(os.getenv("INVENTORY_SHARDS", "8"))
+AVAILABILITY_CACHE_TTL = float(os.getenv("AVAILABILITY_CACHE_TTL", "2"))
+
+availability_cache = TTLCache(ttl=AVAILABILITY_CACHE_TTL)
+
+async def init_inventory(db: AsyncSession, event_id: int, available: int):
+    """Crea los shards del evento. Todo el stock inicial va al shard 0."""
+    await db.execute(
+        insert(EventInventory),
+        [
+            {
+                "event_id": event_id,
+                "shard": shard,
+                "available": available if shard == 0 else 0,
+                "locked": 0,
+                "sold": 0
+            }
+            for shard in range(INVENTORY_SHARDS)
+        ]
+    )
+
+async def adjust_inventory(
+    db: AsyncSession,
+    event_id: int,
+    available: int = 0,
+    locked: int = 0,
+    sold: int = 0,
+):
+    """
+    Aplica un delta a los contadores en la transacción en curso.
+    Debe llamarse antes del commit de la operación que mueve los tickets.
+    """
+    if not (available or locked or sold):
+        return
+    await db.execute(
+        update(EventInventory)
+        .where(
+            EventInventory.event_id == event_id,
+            EventInventory.shard == random.randrange(INVENTORY_SHARDS),
+        )
+        .values(
+            available=EventInventory.available + available,
+            locked=EventInventory.locked + locked,
+            sold=EventInventory.sold + sold,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+async def adjust_inventory_for_tickets(
+    db: AsyncSession,
+    event_ids: Iterable[int],
+    available: int = 0,
+    locked: int = 0,
+    sold: int = 0,
+):
+    """
+    Igual que `adjust_inventory`, pero para tickets de varios eventos:
+    recibe el event_id de cada ticket afectado (uno por ticket, p. ej. de un
+    RETURNING) y aplica el delta multiplicado por los tickets de cada evento.
+    """
+    per_event = defaultdict(int)
+    for event_id in event_ids:
+        per_event[event_id] += 1
+    for event_id, count in sorted(per_event.items()):
+        await adjust_inventory(
+            db, event_id,
+            available=available * count, locked=locked * count, sold=sold * count
+        )
+
+def invalidate_availability(*event_ids: int):
+    """Llamar después del commit para que el polling vea el cambio ya."""
+    for event_id in event_ids:
+        availability_cache.invalidate(event_id)
+
+async def rebuild_inventory(db: AsyncSession, event_id: int):
+    """
+    Recalcula los contadores contando tickets (eventos anteriores a la tabla
+    de inventario). Es el único camino que hace un conteo completo.
+    """
+    # Serializa reconstrucciones concurrentes del mismo evento (varias réplicas)
+    await db.execute(select(func.pg_advisory_xact_lock(event_id)))
+    already_built = await db.scalar(
+        select(EventInventory.shard).where(EventInventory.event_id == event_id).limit(1)
+    )
+    if already_built is not None:
+        await db.commit()
+        return
+
+    # FOR SHARE sobre los tickets del evento: las compras en curso terminan
+    # antes del conteo (y este ve su estado final) y las siguientes esperan al
+    # commit de la reconstrucción, así que su delta cae ya sobre los shards.
+    # Sin el lock, un delta aplicado antes de crear los shards se perdía.
+    tickets = (
+        select(Ticket.status)
+        .where(Ticket.event_id == event_id)
+        .with_for_update(read=True)
+        .subquery()
+    )
+    result = await db.execute(
+        select(
+            func.count().filter(tickets.c.status == TicketStatus.AVAILABLE),
+            func.count().filter(tickets.c.status == TicketStatus.LOCKED),
+            func.count().filter(tickets.c.status == TicketStatus.SOLD),
+        )
+    )
+    available, locked, sold = result.one()
+    await init_inventory(db, event_id, available)
+    await adjust_inventory(db, event_id, locked=locked, sold=sold)
+    await db.commit()
+
+async def get_availability(event_id: int, db: AsyncSession) -> dict | None:
+    """Disponibilidad del evento servida desde la caché TTL."""
+    async def load():
+        result = await db.execute(
+            select(
+                func.sum(EventInventory.available),
+                func.sum(EventInventory.locked),
+                func.sum(EventInventory.sold),
+            ).where(EventInventory.event_id == event_id)
+        )
+        available, locked, sold = result.one()
+
+        if available is None:
+            # Sin contadores: o el evento no existe o es anterior al inventario
+            exists = await db.scalar(select(Event.id).where(Event.id == event_id))
+            if exists is None:
+                return None
+            await rebuild_inventory(db, event_id)
+            return await load()
+
+        return {
+            "event_id": event_id,
+            "available": available,
+            "locked": locked,
+            "sold": sold
+        }
+
+    return await availability_cache.get_or_load(event_id, load)
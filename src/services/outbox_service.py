@@ -0,0 +1,104 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, update, delete, func, bindparam
+from src.database import AsyncSessionLocal
+from src.models.outbox import OutboxMessage
+from src.rabbitmq_client import publisher
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5"))
+# Reintentos: backoff exponencial por mensaje (base * 2^intentos, con tope)
+# y, tras OUTBOX_MAX_ATTEMPTS fallos, el mensaje se aparca para no bloquear
+# ni reintentar sin fin un payload que RabbitMQ nunca va a aceptar
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "1"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "300"))
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1)))
+
+async def enqueue_outbox(db: AsyncSession, queue: str, payloads: list[dict]):
+    """Añade mensajes al outbox dentro de la transacción en curso (sin commit)."""
+    if not payloads:
+        return
+    await db.execute(
+        insert(OutboxMessage),
+        [{"queue": queue, "payload": payload, "attempts": 0} for payload in payloads]
+    )
+
+async def relay_outbox_batch(db: AsyncSession, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Publica un lote del outbox con confirms y borra lo confirmado.
+
+    FOR UPDATE SKIP LOCKED reparte los mensajes entre varios relays en
+    paralelo sin que dos publiquen el mismo. Entrega "al menos una vez":
+    si el relay muere entre el confirm y el commit, el lote se republica.
+    Solo toma mensajes no aparcados cuyo reintento ya toca.
+    """
+    result = await db.execute(
+        select(OutboxMessage.id, OutboxMessage.queue, OutboxMessage.payload, OutboxMessage.attempts)
+        .where(OutboxMessage.parked_at.is_(None), OutboxMessage.next_attempt_at <= func.now())
+        .order_by(OutboxMessage.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    rows = result.all()
+    if not rows:
+        await db.rollback()
+        return 0
+
+    results = await asyncio.gather(
+        *(publisher.publish(row.queue, row.payload, wait=True) for row in rows),
+        return_exceptions=True
+    )
+    published = [row.id for row, res in zip(rows, results) if not isinstance(res, Exception)]
+    failed = [(row, res) for row, res in zip(rows, results) if isinstance(res, Exception)]
+
+    if published:
+        await db.execute(
+            delete(OutboxMessage)
+            .where(OutboxMessage.id.in_(published))
+            .execution_options(synchronize_session=False)
+        )
+    if failed:
+        now = datetime.now(timezone.utc)
+        updates = []
+        for row, exc in failed:
+            attempts = row.attempts + 1
+            parked = attempts >= OUTBOX_MAX_ATTEMPTS
+            if parked:
+                print(f" [outbox] Mensaje {row.id} aparcado tras {attempts} intentos: {exc!r}")
+            updates.append({
+                "b_id": row.id,
+                "attempts": attempts,
+                "last_error": repr(exc)[:1000],
+                "next_attempt_at": now + _backoff(attempts),
+                "parked_at": now if parked else None,
+            })
+        table = OutboxMessage.__table__
+        await db.execute(
+            update(table).where(table.c.id == bindparam("b_id")),
+            updates
+        )
+    await db.commit()
+
+    return len(published)
+
+async def run_outbox_relay(poll_interval: float = OUTBOX_POLL_INTERVAL):
+    """Bucle del relay: vacía el outbox a RabbitMQ mientras haya mensajes."""
+    while True:
+        try:
+            if not publisher.started:
+                await publisher.start()
+            async with AsyncSessionLocal() as db:
+                published = await relay_outbox_batch(db)
+            if published:
+                continue  # Hay más trabajo: seguimos sin esperar
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            print(f" [outbox] Error en el relay: {exc!r}")
+        await asyncio.sleep(poll_interval)
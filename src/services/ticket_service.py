@@ -1,36 +1,318 @@
+import os
+from typing import Awaitable, Callable
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, func
 from fastapi import HTTPException
+from src.cache import TTLCache
+from src.models.event import Event
 from src.models.ticket import Ticket, TicketStatus
+from src.services.inventory_service import (
+    adjust_inventory,
+    adjust_inventory_for_tickets,
+    invalidate_availability
+)
+from src.services.outbox_service import enqueue_outbox
+from src.services.analytics_service import record_sales
+
+NOTIFICATIONS_QUEUE = "eventscale_queue"
+
+# Un ticket nunca cambia de evento: el control de la sala de espera resuelve
+# ticket -> evento aquí y rechaza sin tocar la fila del ticket
+TICKET_EVENT_CACHE_TTL = float(os.getenv("TICKET_EVENT_CACHE_TTL", "3600"))
+ticket_events_cache = TTLCache(ttl=TICKET_EVENT_CACHE_TTL, maxsize=200_000)
+
+async def ticket_event_ids(db: AsyncSession, ticket_ids: list[int]) -> dict[int, int]:
+    """ticket_id -> event_id; los que no existen no aparecen."""
+    found = {}
+    missing = []
+    for ticket_id in ticket_ids:
+        event_id = ticket_events_cache.get(ticket_id)
+        if event_id is None:
+            missing.append(ticket_id)
+        else:
+            found[ticket_id] = event_id
+    if missing:
+        result = await db.execute(
+            select(Ticket.id, Ticket.event_id).where(Ticket.id.in_(missing))
+        )
+        for ticket_id, event_id in result.all():
+            ticket_events_cache.set(ticket_id, event_id)
+            found[ticket_id] = event_id
+    return found
 
-async def buy_ticket_service(ticket_id: int, user_id: int, db: AsyncSession):
+def confirmation_message(email: str, ticket) -> dict:
+    """Cuerpo del correo de confirmación que procesa el worker."""
+    return {
+        "email": email,
+        "ticket_id": ticket.id,
+        "event_id": ticket.event_id,
+        "event": ticket.event_name,
+        "seat": ticket.seat_number,
+        "price": ticket.price,
+        "type": "EMAIL_CONFIRMATION"
+    }
+
+def order_confirmation_message(email: str, tickets) -> dict:
+    """Un solo correo para todos los asientos de una compra múltiple."""
+    return {
+        "email": email,
+        "tickets": [
+            {
+                "ticket_id": t.id,
+                "event_id": t.event_id,
+                "event": t.event_name,
+                "seat": t.seat_number,
+                "price": t.price,
+            }
+            for t in tickets
+        ],
+        "type": "ORDER_CONFIRMATION"
+    }
+
+async def buy_ticket_service(
+    ticket_id: int,
+    user_id: int,
+    db: AsyncSession,
+    email: str | None = None,
+    blocked_event_ids: frozenset[int] = frozenset(),
+    before_commit: Callable[..., Awaitable[None]] | None = None,
+):
     """
     Intenta comprar un ticket manejando concurrencia estricta.
+    Con `email`, el correo de confirmación se encola en el outbox dentro de
+    la misma transacción que la venta. `blocked_event_ids` son los eventos
+    con sala de espera en los que el usuario no tiene turno.
+
+    La compra es un único UPDATE condicional: la condición `status = AVAILABLE`
+    la evalúa Postgres bajo el lock de fila, así que dos compradores nunca
+    pueden quedarse con el mismo asiento y el lock dura una sola sentencia.
+    """
+    # 1. UPDATE ... FROM events WHERE ... AND status = 'available' RETURNING ...
+    # El JOIN con events nos da el nombre del evento sin otra consulta.
+    query = (
+        update(Ticket)
+        .where(
+            Ticket.id == ticket_id,
+            Ticket.status == TicketStatus.AVAILABLE,
+            Ticket.event_id == Event.id,
+            Event.is_cancelled.is_(False),
+        )
+        .values(status=TicketStatus.SOLD, owner_id=user_id, updated_at=func.now())
+        .returning(
+            Ticket.id,
+            Ticket.event_id,
+            Ticket.seat_number,
+            Ticket.price,
+            Event.name.label("event_name"),
+        )
+        # No tocamos el identity map: devolvemos filas, no objetos ORM
+        .execution_options(synchronize_session=False)
+    )
+    if blocked_event_ids:
+        # Sin consulta previa: el filtro va en el propio UPDATE
+        query = query.where(Ticket.event_id.notin_(blocked_event_ids))
+    result = await db.execute(query)
+    sold_ticket = result.one_or_none()
+
+    # 2. Si no se actualizó nada, distinguimos "no existe" de "ya vendido"
+    if sold_ticket is None:
+        await db.rollback()
+        ticket = (await db.execute(
+            select(Ticket.event_id, Event.is_cancelled)
+            .join(Event, Event.id == Ticket.event_id)
+            .where(Ticket.id == ticket_id)
+        )).one_or_none()
+        if ticket is None:
+            raise HTTPException(status_code=404, detail="Ticket no encontrado")
+        if ticket.is_cancelled:
+            raise HTTPException(status_code=409, detail="El evento está cancelado")
+        if ticket.event_id in blocked_event_ids:
+            raise HTTPException(
+                status_code=403,
+                detail="Este evento tiene sala de espera: entra en la cola (/queue) para comprar"
+            )
+        raise HTTPException(status_code=409, detail="El ticket ya no está disponible")
+
+    # 3. Contadores de disponibilidad y notificación, en la misma transacción
+    await adjust_inventory(db, sold_ticket.event_id, available=-1, sold=1)
+    await record_sales(db, [sold_ticket])
+    if email:
+        await enqueue_outbox(db, NOTIFICATIONS_QUEUE, [confirmation_message(email, sold_ticket)])
+
+    # 4. CONFIRMAR LA TRANSACCIÓN (con lo que el llamador añada, p. ej. la
+    # respuesta idempotente)
+    if before_commit is not None:
+        await before_commit(sold_ticket)
+    await db.commit()
+    invalidate_availability(sold_ticket.event_id)
+
+    return sold_ticket
+
+async def buy_best_available_service(
+    event_id: int,
+    user_id: int,
+    quantity: int,
+    db: AsyncSession,
+    min_price: int | None = None,
+    max_price: int | None = None,
+    section: str | None = None,
+    email: str | None = None,
+    before_commit: Callable[..., Awaitable[None]] | None = None,
+):
+    """
+    Compra los `quantity` mejores asientos libres de un evento.
+
+    Los candidatos se bloquean con FOR UPDATE SKIP LOCKED: los compradores
+    concurrentes saltan las filas que otro ya está comprando en lugar de
+    esperar su lock, así que cada uno se queda con asientos distintos.
+    La compra es todo o nada.
+    """
+    # 1. Candidatos (menor id = mejor asiento), saltando filas bloqueadas
+    candidates = (
+        select(Ticket.id)
+        .where(Ticket.event_id == event_id, Ticket.status == TicketStatus.AVAILABLE)
+        .order_by(Ticket.id)
+        .limit(quantity)
+        .with_for_update(skip_locked=True)
+    )
+    if min_price is not None:
+        candidates = candidates.where(Ticket.price >= min_price)
+    if max_price is not None:
+        candidates = candidates.where(Ticket.price <= max_price)
+    if section is not None:
+        candidates = candidates.where(Ticket.section == section)
+    candidates = candidates.cte("candidates")
+
+    # 2. Un solo UPDATE ... FROM candidates, events RETURNING ...
+    query = (
+        update(Ticket)
+        .where(
+            Ticket.id == candidates.c.id,
+            Ticket.status == TicketStatus.AVAILABLE,
+            Ticket.event_id == Event.id,
+            Event.is_cancelled.is_(False),
+        )
+        .values(status=TicketStatus.SOLD, owner_id=user_id, updated_at=func.now())
+        .returning(
+            Ticket.id,
+            Ticket.event_id,
+            Ticket.seat_number,
+            Ticket.section,
+            Ticket.price,
+            Event.name.label("event_name"),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(query)
+    sold_tickets = result.all()
+
+    # 3. Todo o nada: si no alcanzan los asientos, deshacemos
+    if len(sold_tickets) < quantity:
+        await db.rollback()
+        is_cancelled = await db.scalar(select(Event.is_cancelled).where(Event.id == event_id))
+        if is_cancelled is None:
+            raise HTTPException(status_code=404, detail="Evento no encontrado")
+        if is_cancelled:
+            raise HTTPException(status_code=409, detail="El evento está cancelado")
+        raise HTTPException(
+            status_code=409,
+            detail=f"No hay {quantity} tickets disponibles con esos filtros"
+        )
+
+    await adjust_inventory(db, event_id, available=-quantity, sold=quantity)
+    await record_sales(db, sold_tickets)
+    if email:
+        await enqueue_outbox(
+            db, NOTIFICATIONS_QUEUE, [confirmation_message(email, t) for t in sold_tickets]
+        )
+    if before_commit is not None:
+        await before_commit(sold_tickets)
+    await db.commit()
+    invalidate_availability(event_id)
+
+    return sold_tickets
+
+async def buy_tickets_batch_service(
+    ticket_ids: list[int],
+    user_id: int,
+    db: AsyncSession,
+    email: str | None = None,
+    blocked_event_ids: frozenset[int] = frozenset(),
+    before_commit: Callable[..., Awaitable[None]] | None = None,
+):
+    """
+    Compra varios asientos concretos en una sola transacción, todo o nada.
+
+    Los candidatos se bloquean con FOR UPDATE en orden de id: dos compras
+    solapadas piden los locks en el mismo orden, así que una espera a la
+    otra en lugar de bloquearse mutuamente (deadlock).
     """
-    # ELIMINADO: async with db.begin():  <-- Esto causaba el error de doble transacción
-    
-    # 1. SELECT FOR UPDATE
-    # Usamos la transacción que ya viene abierta desde la autenticación (security.py)
-    query = select(Ticket).where(Ticket.id == ticket_id).with_for_update()
+    ticket_ids = sorted(set(ticket_ids))
+
+    # 1. Bloquear en orden de id
+    candidates = (
+        select(Ticket.id)
+        .where(Ticket.id.in_(ticket_ids), Ticket.status == TicketStatus.AVAILABLE)
+        .order_by(Ticket.id)
+        .with_for_update()
+    )
+    if blocked_event_ids:
+        candidates = candidates.where(Ticket.event_id.notin_(blocked_event_ids))
+    candidates = candidates.cte("candidates")
+
+    # 2. Un solo UPDATE ... FROM candidates, events RETURNING ...
+    query = (
+        update(Ticket)
+        .where(
+            Ticket.id == candidates.c.id,
+            Ticket.status == TicketStatus.AVAILABLE,
+            Ticket.event_id == Event.id,
+            Event.is_cancelled.is_(False),
+        )
+        .values(status=TicketStatus.SOLD, owner_id=user_id, updated_at=func.now())
+        .returning(
+            Ticket.id,
+            Ticket.event_id,
+            Ticket.seat_number,
+            Ticket.section,
+            Ticket.price,
+            Event.name.label("event_name"),
+        )
+        .execution_options(synchronize_session=False)
+    )
     result = await db.execute(query)
-    ticket = result.scalar_one_or_none()
-
-    # 2. Validaciones
-    if not ticket:
-        # Importante: Si fallamos, no hacemos commit (el rollback ocurre automático al salir)
-        raise HTTPException(status_code=404, detail="Ticket no encontrado")
-    
-    if ticket.status != TicketStatus.AVAILABLE:
-        raise HTTPException(status_code=400, detail="El ticket ya no está disponible")
-
-    # 3. Actualizar estado (La compra)
-    ticket.status = TicketStatus.SOLD
-    ticket.owner_id = user_id
-    
-    # 4. CONFIRMAR LA TRANSACCIÓN
-    # Como quitamos el bloque 'async with', debemos guardar explícitamente.
+    sold_tickets = sorted(result.all(), key=lambda t: t.id)
+
+    # 3. Todo o nada
+    if len(sold_tickets) < len(ticket_ids):
+        await db.rollback()
+        found = (await db.execute(
+            select(Ticket.id, Ticket.event_id, Event.is_cancelled)
+            .join(Event, Event.id == Ticket.event_id)
+            .where(Ticket.id.in_(ticket_ids))
+        )).all()
+        if len(found) < len(ticket_ids):
+            missing = sorted(set(ticket_ids) - {t.id for t in found})
+            raise HTTPException(status_code=404, detail=f"Tickets no encontrados: {missing}")
+        if any(t.is_cancelled for t in found):
+            raise HTTPException(status_code=409, detail="El evento está cancelado")
+        if any(t.event_id in blocked_event_ids for t in found):
+            raise HTTPException(
+                status_code=403,
+                detail="Este evento tiene sala de espera: entra en la cola (/queue) para comprar"
+            )
+        raise HTTPException(status_code=409, detail="Algunos tickets ya no están disponibles")
+
+    # 4. Contadores y UNA notificación con todos los asientos
+    event_ids = [t.event_id for t in sold_tickets]
+    await adjust_inventory_for_tickets(db, event_ids, available=-1, sold=1)
+    await record_sales(db, sold_tickets)
+    if email:
+        await enqueue_outbox(db, NOTIFICATIONS_QUEUE, [order_confirmation_message(email, sold_tickets)])
+    if before_commit is not None:
+        await before_commit(sold_tickets)
     await db.commit()
-    # Refrescamos el objeto para devolver los datos actualizados
-    await db.refresh(ticket) 
-        
-    return ticket
\ No newline at end of file
+    invalidate_availability(*set(event_ids))
+
+    return sold_tickets
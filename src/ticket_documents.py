@@ -0,0 +1,151 @@
+import hashlib
+import os
+from functools import lru_cache
+from pathlib import Path
+from string import Template
+
+import segno
+
+# Este módulo no toca la base de datos: lo usan el worker y su pool de
+# procesos de renderizado.
+
+TICKET_TEMPLATES_DIR = Path(os.getenv("TICKET_TEMPLATES_DIR", "templates/tickets"))
+TICKET_STORE_DIR = Path(os.getenv("TICKET_STORE_DIR", "var/tickets"))
+
+DEFAULT_TEMPLATE = """EVENTSCALE - ENTRADA
+Evento: $event
+Asiento: $seat
+Precio: $price
+Titular: $email
+Ticket #$ticket_id"""
+
+# --- PLANTILLAS ---
+@lru_cache(maxsize=1024)
+def load_template(event_id: int | None) -> tuple[Template, str]:
+    """
+    Plantilla del evento (`event-<id>.txt`), o `default.txt`, o la de serie.
+    Se lee y parsea una vez por proceso. Devuelve (plantilla, versión): la
+    versión entra en la clave de caché para que cambiar la plantilla obligue
+    a regenerar.
+    """
+    candidates = [TICKET_TEMPLATES_DIR / "default.txt"]
+    if event_id is not None:
+        candidates.insert(0, TICKET_TEMPLATES_DIR / f"event-{event_id}.txt")
+
+    source = DEFAULT_TEMPLATE
+    for path in candidates:
+        if path.is_file():
+            source = path.read_text(encoding="utf-8")
+            break
+    return Template(source), hashlib.sha256(source.encode()).hexdigest()[:16]
+
+def render_lines(job: dict) -> tuple[list[str], str]:
+    template, version = load_template(job.get("event_id"))
+    text = template.safe_substitute(
+        event=job.get("event") or "",
+        seat=job.get("seat") or "-",
+        price=job.get("price") if job.get("price") is not None else "-",
+        email=job["email"],
+        ticket_id=job["ticket_id"],
+    )
+    return text.splitlines(), version
+
+def cache_key(job: dict, version: str) -> str:
+    """Misma entrada + misma plantilla => mismo documento (reenvíos)."""
+    raw = f"{job['ticket_id']}|{job['email']}|{job.get('event_id')}|{job.get('seat')}|{version}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+# --- ALMACÉN DIRECCIONADO POR CONTENIDO ---
+class TicketStore:
+    """
+    objects/<sha256[:2]>/<sha256>.pdf guarda cada documento una sola vez;
+    index/<clave> apunta al documento ya generado para esa entrada.
+    """
+
+    def __init__(self, root: Path = TICKET_STORE_DIR):
+        self.root = Path(root)
+
+    def _object_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / f"{digest}.pdf"
+
+    def _index_path(self, key: str) -> Path:
+        return self.root / "index" / key[:2] / key
+
+    def lookup(self, key: str) -> Path | None:
+        index = self._index_path(key)
+        if not index.is_file():
+            return None
+        path = self._object_path(index.read_text().strip())
+        return path if path.is_file() else None
+
+    def put(self, key: str, data: bytes) -> Path:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not path.is_file():
+            _atomic_write(path, data)
+        _atomic_write(self._index_path(key), digest.encode())
+        return path
+
+def _atomic_write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+# --- RENDER (corre en el pool de procesos) ---
+def render_and_store(key: str, lines: list[str], qr_payload: str, store_root: str) -> str:
+    data = build_ticket_pdf(lines, qr_payload)
+    return str(TicketStore(Path(store_root)).put(key, data))
+
+def build_ticket_pdf(lines: list[str], qr_payload: str) -> bytes:
+    """PDF de una página: texto de la plantilla a la izquierda y QR a la derecha."""
+    width, height = 420, 240
+    content = []
+
+    # Texto (la primera línea es el título)
+    y = height - 40
+    for i, line in enumerate(lines):
+        size = 16 if i == 0 else 11
+        content.append(f"BT /F1 {size} Tf 24 {y} Td ({_pdf_escape(line)}) Tj ET")
+        y -= 24 if i == 0 else 16
+
+    # QR: un rectángulo por módulo oscuro
+    qr = segno.make(qr_payload, error="m")
+    module = 2.2
+    size = len(qr.matrix) * module
+    x0, y0 = width - size - 20, (height - size) / 2
+    content.append("0 g")
+    for row_index, row in enumerate(qr.matrix):
+        for col_index, dark in enumerate(row):
+            if dark:
+                x = x0 + col_index * module
+                y = y0 + size - (row_index + 1) * module
+                content.append(f"{x:.2f} {y:.2f} {module:.2f} {module:.2f} re")
+    content.append("f")
+
+    stream = "\n".join(content).encode("latin-1", errors="replace")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+            f"/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>"
+        ).encode(),
+        b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        pdf += f"{offset:010d} 00000 n \n".encode()
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(pdf)
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+import os
+
+from jose import JWTError, jwt
+from fastapi import HTTPException
+
+# Firma y tokens que no necesitan base de datos (QR de entradas, turnos de la
+# sala de espera). El worker importa de aquí: src/security.py arrastra el
+# motor de SQLAlchemy a través de src.database.
+
+# --- CONFIGURACIÓN ---
+SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey123")
+ALGORITHM = "HS256"
+
+# --- QR DE ENTRADAS ---
+def create_ticket_token(ticket_id: int, event_id: int, email: str):
+    """Payload firmado del QR de la entrada (se valida en el acceso al evento)."""
+    to_encode = {"sub": email, "tid": ticket_id, "eid": event_id, "type": "ticket"}
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def verify_ticket_token(token: str):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        if payload.get("type") != "ticket":
+            raise HTTPException(status_code=400, detail="QR inválido")
+        return payload
+    except JWTError:
+        raise HTTPException(status_code=400, detail="QR inválido")
+
+# --- SALA DE ESPERA ---
+def create_queue_token(email: str, event_id: int, position: int, generation: float, expires_in: int):
+    """
+    Turno en la sala de espera de un evento (ver src/waiting_room.py).
+    `generation` identifica la apertura de la sala: al reabrirla, los turnos
+    anteriores dejan de valer.
+    """
+    expire = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+    to_encode = {
+        "sub": email, "eid": event_id, "pos": position, "gen": generation,
+        "exp": expire, "type": "queue"
+    }
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def decode_queue_token(token: str):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        if payload.get("type") != "queue":
+            raise HTTPException(status_code=403, detail="Turno de la sala de espera inválido")
+        return payload
+    except JWTError:
+        raise HTTPException(status_code=403, detail="Turno de la sala de espera inválido o caducado")
@@ -0,0 +1,220 @@
+import math
+import os
+import time
+from dataclasses import dataclass, field
+
+from fastapi import Depends, Header, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.cache import TTLCache
+from src.models.user import User
+from src.security import get_current_user
+from src.services.ticket_service import ticket_event_ids
+from src.tokens import create_queue_token, decode_queue_token
+
+# memory: estado en el proceso (una sola réplica)
+# redis:  estado compartido entre réplicas (servidor compatible con Redis)
+WAITING_ROOM_BACKEND = os.getenv("WAITING_ROOM_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+QUEUE_TOKEN_TTL = int(os.getenv("QUEUE_TOKEN_TTL", "3600"))
+# Tiempo que un turno admitido puede comprar antes de caducar
+ADMISSION_WINDOW = int(os.getenv("ADMISSION_WINDOW", "600"))
+# Con backend redis, cada réplica cachea la lista de salas abiertas este tiempo
+ROOMS_CACHE_TTL = float(os.getenv("WAITING_ROOM_CACHE_TTL", "1"))
+
+@dataclass
+class Room:
+    event_id: int
+    rate: float        # Turnos admitidos por segundo
+    burst: int         # Turnos admitidos nada más abrir
+    opened_at: float   # time.time(); también es la generación de los turnos
+
+    def admitted_up_to(self, now: float) -> int:
+        """Último turno admitido: la frontera avanza `rate` turnos por segundo."""
+        return self.burst + math.floor(max(0.0, now - self.opened_at) * self.rate)
+
+    def admitted_at(self, position: int) -> float:
+        if position <= self.burst:
+            return self.opened_at
+        return self.opened_at + (position - self.burst) / self.rate
+
+# --- ALMACENES ---
+class MemoryRoomStore:
+    def __init__(self):
+        self._rooms: dict[int, Room] = {}
+        self._counters: dict[int, int] = {}
+        self._positions: dict[int, dict[str, int]] = {}
+
+    async def open(self, room: Room):
+        self._rooms[room.event_id] = room
+        self._counters.setdefault(room.event_id, 0)
+        self._positions.setdefault(room.event_id, {})
+
+    async def close(self, event_id: int):
+        self._rooms.pop(event_id, None)
+        self._counters.pop(event_id, None)
+        self._positions.pop(event_id, None)
+
+    async def rooms(self) -> dict[int, Room]:
+        return self._rooms
+
+    async def assign_position(self, event_id: int, user_key: str) -> int:
+        positions = self._positions[event_id]
+        if user_key not in positions:
+            self._counters[event_id] += 1
+            positions[user_key] = self._counters[event_id]
+        return positions[user_key]
+
+class RedisRoomStore:
+    # Mismo usuario => mismo turno; si no tiene, INCR atómico
+    _ASSIGN = """
+    local existing = redis.call('HGET', KEYS[2], ARGV[1])
+    if existing then return tonumber(existing) end
+    local position = redis.call('INCR', KEYS[1])
+    redis.call('HSET', KEYS[2], ARGV[1], position)
+    return position
+    """
+
+    def __init__(self, url: str):
+        # Dependencia opcional: solo hace falta con WAITING_ROOM_BACKEND=redis
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url, decode_responses=True)
+        self._assign = self._redis.register_script(self._ASSIGN)
+
+    async def open(self, room: Room):
+        await self._redis.hset("wr:rooms", room.event_id, f"{room.rate}:{room.burst}:{room.opened_at}")
+
+    async def close(self, event_id: int):
+        await self._redis.hdel("wr:rooms", event_id)
+        await self._redis.delete(f"wr:counter:{event_id}", f"wr:positions:{event_id}")
+
+    async def rooms(self) -> dict[int, Room]:
+        rooms = {}
+        for event_id, raw in (await self._redis.hgetall("wr:rooms")).items():
+            rate, burst, opened_at = raw.split(":")
+            rooms[int(event_id)] = Room(int(event_id), float(rate), int(burst), float(opened_at))
+        return rooms
+
+    async def assign_position(self, event_id: int, user_key: str) -> int:
+        return int(await self._assign(
+            keys=[f"wr:counter:{event_id}", f"wr:positions:{event_id}"], args=[user_key]
+        ))
+
+if WAITING_ROOM_BACKEND == "redis":
+    store = RedisRoomStore(REDIS_URL)
+    _rooms_cache = TTLCache(ttl=ROOMS_CACHE_TTL, maxsize=1)
+else:
+    store = MemoryRoomStore()
+    _rooms_cache = None
+
+async def get_rooms() -> dict[int, Room]:
+    if _rooms_cache is None:
+        return await store.rooms()
+    return await _rooms_cache.get_or_load("rooms", store.rooms)
+
+# --- OPERACIONES ---
+async def open_room(event_id: int, rate: float, burst: int) -> Room:
+    room = Room(event_id=event_id, rate=rate, burst=burst, opened_at=time.time())
+    await store.open(room)
+    if _rooms_cache is not None:
+        _rooms_cache.clear()
+    return room
+
+async def close_room(event_id: int):
+    await store.close(event_id)
+    if _rooms_cache is not None:
+        _rooms_cache.clear()
+
+def queue_status(room: Room, position: int, now: float | None = None) -> dict:
+    now = time.time() if now is None else now
+    frontier = room.admitted_up_to(now)
+    ahead = max(0, position - frontier)
+    return {
+        "event_id": room.event_id,
+        "position": position,
+        "admitted": ahead == 0,
+        "ahead": ahead,
+        "eta_seconds": math.ceil(ahead / room.rate) if ahead else 0,
+    }
+
+async def join_room(event_id: int, email: str) -> dict:
+    room = (await get_rooms()).get(event_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Este evento no tiene sala de espera abierta")
+    position = await store.assign_position(event_id, email)
+    token = create_queue_token(email, event_id, position, room.opened_at, QUEUE_TOKEN_TTL)
+    return {"queue_token": token, **queue_status(room, position)}
+
+def _check_generation(room: Room, payload: dict):
+    # Turno de una apertura anterior de la sala (cerrada y reabierta después)
+    if payload.get("gen") != room.opened_at:
+        raise HTTPException(status_code=403, detail="Tu turno es de una sala anterior, vuelve a la cola")
+
+async def status_from_token(token: str) -> dict:
+    payload = decode_queue_token(token)
+    room = (await get_rooms()).get(payload["eid"])
+    if room is None:
+        # Sala cerrada: venta libre
+        return {"event_id": payload["eid"], "position": payload["pos"], "admitted": True,
+                "ahead": 0, "eta_seconds": 0}
+    _check_generation(room, payload)
+    return queue_status(room, payload["pos"])
+
+# --- CONTROL DE ACCESO A LAS COMPRAS ---
+@dataclass
+class Admission:
+    """
+    Resultado del control de acceso, calculado sin tocar Postgres.
+    `blocked_event_ids`: eventos con sala abierta para los que el usuario
+    no tiene turno admitido. Las compras se rechazan antes de la transacción
+    (`require` / `require_tickets`); los servicios además los excluyen en el
+    propio UPDATE.
+    """
+    admitted_event_id: int | None = None
+    blocked_event_ids: frozenset[int] = field(default_factory=frozenset)
+
+    def require(self, event_id: int):
+        if event_id in self.blocked_event_ids:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Este evento tiene sala de espera: entra en la cola (/queue) para comprar"
+            )
+
+    async def require_tickets(self, db: AsyncSession, ticket_ids: list[int]):
+        """`require` para compras por ticket: el evento sale de una caché."""
+        if not self.blocked_event_ids:
+            return
+        for event_id in (await ticket_event_ids(db, ticket_ids)).values():
+            self.require(event_id)
+
+async def get_admission(
+    x_queue_token: str | None = Header(None),
+    current_user: User = Depends(get_current_user)
+) -> Admission:
+    rooms = await get_rooms()
+    if not rooms:
+        return Admission()
+
+    admitted_event_id = None
+    if x_queue_token:
+        payload = decode_queue_token(x_queue_token)
+        if payload["sub"] != current_user.email:
+            raise HTTPException(status_code=403, detail="El turno pertenece a otro usuario")
+        room = rooms.get(payload["eid"])
+        if room is not None:
+            _check_generation(room, payload)
+            now = time.time()
+            if payload["pos"] > room.admitted_up_to(now):
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="Todavía no es tu turno",
+                    headers={"Retry-After": str(queue_status(room, payload["pos"], now)["eta_seconds"])}
+                )
+            if now > room.admitted_at(payload["pos"]) + ADMISSION_WINDOW:
+                raise HTTPException(status_code=403, detail="Tu turno ha caducado, vuelve a la cola")
+        admitted_event_id = payload["eid"]
+
+    return Admission(
+        admitted_event_id=admitted_event_id,
+        blocked_event_ids=frozenset(rooms) - {admitted_event_id}
+    )
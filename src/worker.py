@@ -1,37 +1,345 @@
 import asyncio
 import json
+import multiprocessing
 import os
+import signal
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
 import aio_pika
+from prometheus_client import start_http_server
+from src.rabbitmq_client import (
+    RABBITMQ_URL,
+    MAIN_QUEUE,
+    DEAD_LETTER_EXCHANGE,
+    RETRY_EXCHANGE,
+    RETRY_DELAYS,
+    MAX_ATTEMPTS,
+    declare_queue,
+    retry_queue_name
+)
+from src.metrics import WORKER_JOB_SECONDS, WORKER_JOBS
+from src.tokens import create_ticket_token
+from src.ticket_documents import (
+    TICKET_STORE_DIR,
+    TicketStore,
+    cache_key,
+    render_and_store,
+    render_lines
+)
+
+# --- CONFIGURACIÓN ---
+WORKER_PREFETCH = int(os.getenv("WORKER_PREFETCH", "100"))        # Mensajes sin ack por conexión
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "8"))    # Lotes procesándose a la vez
+WORKER_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "25"))
+WORKER_BATCH_TIMEOUT = float(os.getenv("WORKER_BATCH_TIMEOUT", "0.5"))  # Espera máx. para llenar un lote
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))        # >1: un proceso por núcleo
+RENDER_PROCESSES = int(os.getenv("RENDER_PROCESSES", str(os.cpu_count() or 2)))
+# /metrics de Prometheus; con varios procesos, uno por puerto (puerto + índice)
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))  # 0 = desactivado
+
+# Pool de procesos para el render (CPU) y almacén de documentos generados
+render_pool: ProcessPoolExecutor | None = None
+ticket_store = TicketStore(TICKET_STORE_DIR)
 
-RABBITMQ_URL = os.getenv("RABBITMQ_URL")
+class PoisonMessage(Exception):
+    """El mensaje nunca podrá procesarse (JSON inválido, campos que faltan...)."""
 
-async def process_message(message: aio_pika.IncomingMessage):
-    async with message.process():
+# Campos obligatorios por tipo de mensaje
+REQUIRED_FIELDS = {
+    "EMAIL_CONFIRMATION": {"email", "ticket_id"},
+    "ORDER_CONFIRMATION": {"email", "tickets"},
+    "TICKETS_RELEASED": {"email", "tickets"},
+}
+
+def parse_job(message: aio_pika.abc.AbstractIncomingMessage) -> dict:
+    try:
         body = json.loads(message.body)
-        print(f" [x] Recibido tarea: {body['type']} para {body['email']}")
-        
-        # Simular procesamiento pesado (generar PDF, enviar email)
-        await asyncio.sleep(2) 
-        
-        print(f" [v] Correo enviado a {body['email']} - Ticket {body['ticket_id']}")
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise PoisonMessage(f"JSON inválido: {exc}")
+    if not isinstance(body, dict):
+        raise PoisonMessage("El cuerpo no es un objeto JSON")
+    if "type" not in body:
+        raise PoisonMessage("Faltan campos: ['type']")
+    if not isinstance(body["type"], str):
+        raise PoisonMessage("`type` debe ser un texto")
+    missing = REQUIRED_FIELDS.get(body["type"], set()) - body.keys()
+    if missing:
+        raise PoisonMessage(f"Faltan campos: {sorted(missing)}")
+    if "tickets" in REQUIRED_FIELDS.get(body["type"], ()) and not (
+        isinstance(body["tickets"], list)
+        and body["tickets"]
+        and all(isinstance(t, dict) and "ticket_id" in t for t in body["tickets"])
+    ):
+        raise PoisonMessage("`tickets` debe ser una lista de entradas con ticket_id")
+    return body
+
+# --- TAREAS ---
+async def render_ticket_document(job: dict) -> tuple[str, bool]:
+    """
+    Devuelve (ruta del PDF, venía de caché). Los reenvíos de la misma
+    entrada se sirven del almacén sin volver a renderizar.
+    """
+    lines, version = render_lines(job)
+    key = cache_key(job, version)
+    cached = ticket_store.lookup(key)
+    if cached is not None:
+        return str(cached), True
+
+    qr_payload = create_ticket_token(job["ticket_id"], job.get("event_id"), job["email"])
+    path = await asyncio.get_running_loop().run_in_executor(
+        render_pool, render_and_store, key, lines, qr_payload, str(ticket_store.root)
+    )
+    return path, False
+
+async def send_confirmation_emails(jobs: list[dict]):
+    """Envío en bloque de confirmaciones (una sola 'conexión SMTP' por lote)."""
+    # 1. Documentos de las entradas (en paralelo en el pool de procesos)
+    documents = await asyncio.gather(*(render_ticket_document(job) for job in jobs))
+    cached = sum(1 for _, from_cache in documents if from_cache)
+    print(f" [x] Enviando {len(jobs)} confirmaciones ({cached} PDFs desde caché)")
+
+    # 2. Simular el envío por SMTP del lote
+    await asyncio.sleep(0.2)
+
+    for job, (path, _) in zip(jobs, documents):
+        print(f" [v] Correo enviado a {job['email']} - Ticket {job['ticket_id']} ({path})")
+
+async def send_order_confirmations(orders: list[dict]):
+    """Compras múltiples: un correo por pedido con el PDF de cada asiento."""
+    jobs = [
+        {**ticket, "email": order["email"]}
+        for order in orders
+        for ticket in order["tickets"]
+    ]
+    documents = await asyncio.gather(*(render_ticket_document(job) for job in jobs))
+    cached = sum(1 for _, from_cache in documents if from_cache)
+    print(f" [x] Enviando {len(orders)} pedidos, {len(jobs)} entradas ({cached} PDFs desde caché)")
+
+    await asyncio.sleep(0.2)
+
+    paths = iter(path for path, _ in documents)
+    for order in orders:
+        attachments = [next(paths) for _ in order["tickets"]]
+        print(f" [v] Correo enviado a {order['email']} - {len(attachments)} entradas ({', '.join(attachments)})")
+
+async def send_release_notices(notices: list[dict]):
+    """Avisos de entradas anuladas por un administrador (sin PDF)."""
+    print(f" [x] Enviando {len(notices)} avisos de anulación")
+    await asyncio.sleep(0.2)
+    for notice in notices:
+        seats = ", ".join(str(t.get("seat") or t["ticket_id"]) for t in notice["tickets"])
+        print(f" [v] Aviso enviado a {notice['email']} - {notice.get('reason')}: {seats}")
+
+HANDLERS = {
+    "EMAIL_CONFIRMATION": send_confirmation_emails,
+    "ORDER_CONFIRMATION": send_order_confirmations,
+    "TICKETS_RELEASED": send_release_notices,
+}
+
+# --- REINTENTOS ---
+class RetryRouter:
+    """
+    Reenvía los mensajes fallidos al siguiente escalón de reintento (backoff
+    exponencial por TTL) o, agotados los intentos, a la DLQ. El original solo
+    se confirma cuando el broker confirma la copia: nunca se pierde y nunca
+    vuelve a la cola en un bucle inmediato.
+    """
+
+    def __init__(self, channel: aio_pika.abc.AbstractChannel):
+        self.channel = channel
+
+    async def setup(self):
+        self.retry_exchange = await self.channel.get_exchange(RETRY_EXCHANGE)
+        self.dead_letter_exchange = await self.channel.get_exchange(DEAD_LETTER_EXCHANGE)
+
+    async def fail(self, message: aio_pika.abc.AbstractIncomingMessage, error: str, poison: bool = False):
+        headers = dict(message.headers or {})
+        attempts = int(headers.get("x-attempts", 0)) + 1
+        headers.update({"x-attempts": attempts, "x-last-error": error[:500]})
+
+        if poison or attempts >= MAX_ATTEMPTS:
+            exchange, routing_key = self.dead_letter_exchange, MAIN_QUEUE
+            print(f" [!] Mensaje a la DLQ tras {attempts} intento(s): {error}")
+        else:
+            step = min(attempts, len(RETRY_DELAYS))
+            exchange, routing_key = self.retry_exchange, retry_queue_name(step)
+            print(f" [~] Reintento {attempts} en {RETRY_DELAYS[step - 1]}s: {error}")
+
+        try:
+            await exchange.publish(
+                aio_pika.Message(
+                    body=message.body,
+                    headers=headers,
+                    content_type=message.content_type,
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+                ),
+                routing_key=routing_key,
+            )
+        except Exception as exc:
+            # Sin copia confirmada, el original vuelve a la cola tal cual
+            print(f" [!] No se pudo reenviar el mensaje ({exc!r}), vuelve a la cola")
+            await message.nack(requeue=True)
+            return
+        await message.ack()
+
+async def process_batch(messages: list[aio_pika.abc.AbstractIncomingMessage], retries: RetryRouter):
+    """
+    Procesa un lote: los mensajes inválidos van directos a la DLQ y el resto
+    se agrupa por tipo para que cada handler trabaje en bloque. Si un handler
+    falla, su grupo pasa al siguiente escalón de reintento.
+    """
+    by_type = defaultdict(list)
+    for message in messages:
+        try:
+            job = parse_job(message)
+            if job["type"] not in HANDLERS:
+                raise PoisonMessage(f"Tipo desconocido: {job['type']}")
+        except PoisonMessage as exc:
+            await retries.fail(message, str(exc), poison=True)
+            continue
+        except Exception as exc:
+            # Cualquier otro fallo validando el cuerpo también es permanente:
+            # sin ack ni nack el mensaje ocuparía prefetch hasta cerrar el canal
+            await retries.fail(message, f"Mensaje inválido: {exc!r}", poison=True)
+            continue
+        by_type[job["type"]].append((message, job))
+
+    for job_type, items in by_type.items():
+        start = time.perf_counter()
+        try:
+            await HANDLERS[job_type]([job for _, job in items])
+        except Exception as exc:
+            _observe_jobs(job_type, "failed", start, len(items))
+            for message, _ in items:
+                await retries.fail(message, f"{job_type}: {exc!r}")
+        else:
+            _observe_jobs(job_type, "ok", start, len(items))
+            for message, _ in items:
+                await message.ack()
+
+def _observe_jobs(job_type: str, outcome: str, start: float, count: int):
+    WORKER_JOB_SECONDS.labels(job_type, outcome).observe(time.perf_counter() - start)
+    WORKER_JOBS.labels(job_type, outcome).inc(count)
+
+# --- CONSUMIDOR ---
+class BatchingConsumer:
+    """
+    Agrupa los mensajes entregados en lotes (WORKER_BATCH_SIZE o
+    WORKER_BATCH_TIMEOUT, lo que llegue antes) y procesa como mucho
+    WORKER_CONCURRENCY lotes a la vez.
+    """
+
+    def __init__(self, retries: RetryRouter):
+        self.retries = retries
+        self._buffer: asyncio.Queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(WORKER_CONCURRENCY)
+        self._in_flight: set[asyncio.Task] = set()
+
+    async def on_message(self, message: aio_pika.abc.AbstractIncomingMessage):
+        await self._buffer.put(message)
+
+    async def run(self, stopping: asyncio.Event):
+        loop = asyncio.get_running_loop()
+        while not (stopping.is_set() and self._buffer.empty()):
+            try:
+                first = await asyncio.wait_for(self._buffer.get(), timeout=WORKER_BATCH_TIMEOUT)
+            except asyncio.TimeoutError:
+                continue
+            batch = [first]
+            deadline = loop.time() + WORKER_BATCH_TIMEOUT
+            while len(batch) < WORKER_BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._buffer.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._run_batch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+        # Apagado ordenado: terminamos lo que ya estaba en curso
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def _run_batch(self, batch):
+        try:
+            await process_batch(batch, self.retries)
+        except Exception as exc:
+            # La tarea no la espera nadie: que el error quede en el log
+            print(f" [!] Error procesando un lote de {len(batch)} mensajes: {exc!r}")
+        finally:
+            self._semaphore.release()
+
+async def main(index: int = 0):
+    global render_pool
+    if WORKER_METRICS_PORT:
+        start_http_server(WORKER_METRICS_PORT + index)
+    render_pool = ProcessPoolExecutor(max_workers=RENDER_PROCESSES)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
 
-async def main():
     # Conexión resiliente (básica)
     connection = await aio_pika.connect_robust(RABBITMQ_URL)
     
     async with connection:
         channel = await connection.channel()
+        # Cuántos mensajes sin confirmar nos entrega el broker a la vez
+        await channel.set_qos(prefetch_count=WORKER_PREFETCH)
         
-        # Declarar la cola (debe coincidir con el productor)
-        queue = await channel.declare_queue("eventscale_queue", durable=True)
-        
-        print(" [*] Worker esperando mensajes...")
+        # Declarar la cola (misma topología que el productor)
+        queue = await declare_queue(channel, MAIN_QUEUE)
+
+        # Canal aparte, con confirms, para reenviar reintentos y dead letters
+        retries = RetryRouter(await connection.channel(publisher_confirms=True))
+        await retries.setup()
         
-        # Consumir mensajes
-        await queue.consume(process_message)
+        print(f" [*] Worker {os.getpid()} esperando mensajes...")
         
-        # Mantener el script corriendo
-        await asyncio.Future()
+        consumer = BatchingConsumer(retries)
+        consumer_tag = await queue.consume(consumer.on_message)
+        runner = asyncio.create_task(consumer.run(stopping))
+
+        await stopping.wait()
+        print(f" [*] Worker {os.getpid()} deteniéndose, terminando trabajos en curso...")
+        # Dejamos de recibir; lo ya entregado se procesa antes de cerrar
+        await queue.cancel(consumer_tag)
+        await runner
+
+    render_pool.shutdown(wait=True)
+
+def run_worker_process(index: int = 0):
+    asyncio.run(main(index))
+
+def run_pool(processes: int):
+    """Modo multiproceso: un worker asyncio por núcleo."""
+    children = [
+        multiprocessing.Process(target=run_worker_process, args=(i,), name=f"worker-{i}")
+        for i in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    def forward(signum, frame):
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for child in children:
+        child.join()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if WORKER_PROCESSES > 1:
+        run_pool(WORKER_PROCESSES)
+    else:
+        run_worker_process()